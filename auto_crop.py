@@ -0,0 +1,204 @@
+"""自动裁切建议：抽样少量帧，检测黑边并按画面活跃度给出裁切区域
+
+只在均匀分布的时间点读取关键帧（ffmpeg 输入端 seek + 跳过非关键帧），
+不做完整解码；分析用 NumPy 在灰度图上做整行/整列归约，一小时的素材也只需数秒。
+
+示例:
+    python auto_crop.py "素材/*.mp4" --square
+"""
+
+import argparse
+import glob
+import json
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_modules import LazyModule, ffmpeg_binary
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+# 抽样帧数
+SAMPLE_COUNT = 24
+# 亮度（Y）不超过该值视为黑色，有限范围的黑为 16
+BLACK_LEVEL = 32
+# 一行/一列中亮像素占比超过该值（在任一抽样帧中）即视为画面内容
+CONTENT_FRACTION = 0.02
+# 活跃度分析时的缩小倍数
+ACTIVITY_SCALE = 4
+# 得分不低于最高分该比例的窗口中，取最靠近中心的一个
+CENTER_TOLERANCE = 0.98
+
+
+def probe_video(path):
+    """返回 (宽, 高, 时长秒)"""
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError(f"无法打开视频文件: {path}")
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+    return width, height, frames / fps
+
+
+def read_keyframe_gray(path, seconds, size):
+    """读取 seconds 之前最近的关键帧的亮度平面，失败返回 None"""
+    width, height = size
+    cmd = [
+        ffmpeg_binary(),
+        "-loglevel",
+        "error",
+        "-skip_frame",
+        "nokey",
+        # 直接输出 seek 落到的关键帧，不再向后解码到精确时间点
+        "-noaccurate_seek",
+        "-ss",
+        f"{seconds:.3f}",
+        "-i",
+        path,
+        "-map",
+        "0:v:0",
+        # 关键帧时间戳早于 seek 点，默认的帧率同步会把它丢弃
+        "-fps_mode",
+        "passthrough",
+        "-frames:v",
+        "1",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "gray",
+        "pipe:1",
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if len(result.stdout) != width * height:
+        return None
+    return np.frombuffer(result.stdout, np.uint8).reshape(height, width)
+
+
+def sample_frames(path, count=SAMPLE_COUNT, workers=4):
+    """在 5%–95% 的时间范围内均匀抽取 count 帧，返回 (灰度帧列表, (宽, 高))"""
+    width, height, duration = probe_video(path)
+    times = np.linspace(duration * 0.05, duration * 0.95, count) if duration else [0]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = pool.map(lambda t: read_keyframe_gray(path, t, (width, height)), times)
+        frames = [f for f in frames if f is not None]
+    if not frames:
+        raise RuntimeError(f"无法读取视频画面: {path}")
+    return frames, (width, height)
+
+
+def content_bounds(frames):
+    """去掉所有抽样帧中都是黑色的边缘行列，返回内容区域 (x1, y1, x2, y2)"""
+    height, width = frames[0].shape
+    row_fraction = np.zeros(height)
+    col_fraction = np.zeros(width)
+    for frame in frames:
+        bright = frame > BLACK_LEVEL
+        np.maximum(row_fraction, bright.mean(axis=1), out=row_fraction)
+        np.maximum(col_fraction, bright.mean(axis=0), out=col_fraction)
+    rows = np.flatnonzero(row_fraction > CONTENT_FRACTION)
+    cols = np.flatnonzero(col_fraction > CONTENT_FRACTION)
+    if rows.size == 0 or cols.size == 0:
+        return (0, 0, width, height)
+    return (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+
+
+def activity_map(frames, scale=ACTIVITY_SCALE):
+    """缩小后的活跃度图：抽样帧间的亮度标准差 + 平均梯度强度"""
+    height, width = frames[0].shape
+    small_size = (max(1, width // scale), max(1, height // scale))
+    stack = np.stack(
+        [cv2.resize(f, small_size, interpolation=cv2.INTER_AREA) for f in frames]
+    ).astype(np.float32)
+    temporal = stack.std(axis=0)
+    gradient = np.zeros_like(temporal)
+    gradient[:, 1:] += np.abs(np.diff(stack, axis=2)).mean(axis=0)
+    gradient[1:, :] += np.abs(np.diff(stack, axis=1)).mean(axis=0)
+    return temporal + 0.5 * gradient
+
+
+def best_window(weights, window):
+    """在一维权重上选择和最大的定长窗口，近似相同时取最靠近中心的，返回起点"""
+    if window >= len(weights):
+        return 0
+    sums = np.convolve(weights, np.ones(window), mode="valid")
+    candidates = np.flatnonzero(sums >= sums.max() * CENTER_TOLERANCE)
+    center = (len(weights) - window) / 2
+    return int(candidates[np.argmin(np.abs(candidates - center))])
+
+
+def square_crop(bounds, activity, scale=ACTIVITY_SCALE):
+    """在内容区域内沿长边滑动，选择活跃度最高的正方形"""
+    x1, y1, x2, y2 = bounds
+    side = min(x2 - x1, y2 - y1)
+    region = activity[y1 // scale : y2 // scale, x1 // scale : x2 // scale]
+    if x2 - x1 > side:
+        offset = best_window(region.sum(axis=0), side // scale) * scale
+        x1 = min(x1 + offset, x2 - side)
+    elif y2 - y1 > side:
+        offset = best_window(region.sum(axis=1), side // scale) * scale
+        y1 = min(y1 + offset, y2 - side)
+    return (x1, y1, x1 + side, y1 + side)
+
+
+def align_even(crop):
+    """起点向内取偶数、宽高取偶数，满足 yuv420p 编码要求"""
+    x1, y1, x2, y2 = crop
+    x1 += x1 % 2
+    y1 += y1 % 2
+    width = (x2 - x1) // 2 * 2
+    height = (y2 - y1) // 2 * 2
+    return (x1, y1, x1 + width, y1 + height)
+
+
+def analyse_video(path, square=False, samples=SAMPLE_COUNT):
+    """返回建议：{"crop", "content", "size", "samples"}
+
+    content 为去黑边后的内容区域；crop 在自由模式下即内容区域，
+    正方形模式下为内容区域内活跃度最高的正方形。
+    """
+    frames, size = sample_frames(path, samples)
+    bounds = content_bounds(frames)
+    crop = bounds
+    if square:
+        crop = align_even(square_crop(bounds, activity_map(frames)))
+        # 对齐后保持正方形
+        side = min(crop[2] - crop[0], crop[3] - crop[1])
+        crop = (crop[0], crop[1], crop[0] + side, crop[1] + side)
+    else:
+        crop = align_even(bounds)
+    return {"crop": crop, "content": bounds, "size": size, "samples": len(frames)}
+
+
+def suggest_crop(path, square=False, samples=SAMPLE_COUNT):
+    """只返回建议的裁切区域 (x1, y1, x2, y2)"""
+    return analyse_video(path, square, samples)["crop"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="自动检测黑边并给出裁切建议")
+    parser.add_argument("inputs", nargs="+", help="输入视频，支持通配符")
+    parser.add_argument("--square", action="store_true", help="给出 1:1 正方形裁切")
+    parser.add_argument("--samples", type=int, default=SAMPLE_COUNT)
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for pattern in args.inputs:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            try:
+                result = analyse_video(path, args.square, args.samples)
+            except Exception as e:
+                failed += 1
+                print(f"[失败] {path}: {e}")
+                continue
+            print(json.dumps({"input": path, **result}, ensure_ascii=False))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
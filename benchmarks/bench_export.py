@@ -0,0 +1,294 @@
+"""导出性能基准：本地生成合成视频，按矩阵运行裁切导出，输出 JSON 并可与基线对比
+
+不需要网络和外部素材，合成视频由 ffmpeg 的 testsrc2/sine 生成并缓存。
+每个用例在独立子进程中运行，以便准确统计峰值内存（含 ffmpeg 编码子进程）。
+峰值内存依赖 resource 模块，仅支持 Linux/macOS。
+
+示例:
+    python benchmarks/bench_export.py -o bench.json
+    python benchmarks/bench_export.py --resolutions 720,1080 --baseline bench.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+from moviepy.config import get_setting  # noqa: E402
+
+import crop_engine  # noqa: E402
+
+# 分辨率名称 -> (宽, 高)
+RESOLUTIONS = {
+    "480": (854, 480),
+    "720": (1280, 720),
+    "1080": (1920, 1080),
+    "1440": (2560, 1440),
+    "2160": (3840, 2160),
+}
+DEFAULT_CLIP_DIR = os.path.join(tempfile.gettempdir(), "crop_bench_clips")
+
+
+def synthetic_clip(clip_dir, resolution, fps, duration, audio):
+    """生成（或复用已缓存的）合成测试视频，返回路径"""
+    width, height = RESOLUTIONS[resolution]
+    name = f"synth_{resolution}p{fps}_{duration}s_{'a' if audio else 'na'}.mp4"
+    path = os.path.join(clip_dir, name)
+    if os.path.exists(path):
+        return path
+    os.makedirs(clip_dir, exist_ok=True)
+    cmd = [
+        get_setting("FFMPEG_BINARY"),
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={width}x{height}:rate={fps}:duration={duration}",
+    ]
+    if audio:
+        cmd += ["-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}"]
+        cmd += ["-c:a", "aac"]
+    cmd += [
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-g",
+        str(fps * 2),
+        "-pix_fmt",
+        "yuv420p",
+        path + ".part.mp4",
+    ]
+    subprocess.run(cmd, check=True)
+    os.replace(path + ".part.mp4", path)
+    return path
+
+
+def crop_for(name, width, height):
+    """居中的正方形裁切：full 为整个画面高度，half 为一半高度"""
+    side = height if name == "full" else height // 2
+    x1 = (width - side) // 2
+    y1 = (height - side) // 2
+    return (x1, y1, x1 + side, y1 + side)
+
+
+def measure_decode(path, max_frames):
+    """单独测解码速度"""
+    cap = cv2.VideoCapture(path)
+    count = 0
+    start = time.perf_counter()
+    while count < max_frames:
+        ret, _ = cap.read()
+        if not ret:
+            break
+        count += 1
+    elapsed = time.perf_counter() - start
+    cap.release()
+    return count / elapsed if elapsed > 0 else 0.0
+
+
+def measure_transform(path, crop, target_size, max_frames=60):
+    """单独测裁切缩放速度（先解码到内存，再计时）
+
+    不缩放时计时引擎实际做的复制：编码端需要连续内存，裁切视图被复制为连续数组
+    （裁切占满整行时本身连续，与引擎一样不复制）。
+    """
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    x1, y1, x2, y2 = crop
+    start = time.perf_counter()
+    for frame in frames:
+        cropped = frame[y1:y2, x1:x2]
+        if target_size:
+            cv2.resize(cropped, target_size)
+        else:
+            np.ascontiguousarray(cropped)
+    elapsed = time.perf_counter() - start
+    return len(frames) / elapsed if elapsed > 0 else 0.0
+
+
+def run_case(case):
+    """在当前（子）进程中运行一个用例，返回结果字典"""
+    with tempfile.TemporaryDirectory(prefix="crop_bench_") as out_dir:
+        job = crop_engine.CropJob(
+            case["clip"],
+            os.path.join(out_dir, "out.mp4"),
+            case["crop"],
+            case["target_size"],
+            engine=case["engine"],
+        )
+        stats = crop_engine.export_video(job)
+        duration = stats["frames"] / case["fps"] if case["fps"] else 0
+        result = {
+            "export_fps": round(stats["fps"], 2),
+            "wall_time": round(stats["wall_time"], 3),
+            "output_bytes": stats["output_bytes"],
+            "output_kbps": (
+                round(stats["output_bytes"] * 8 / duration / 1000, 1) if duration else 0
+            ),
+        }
+    # 导出刚结束时读取峰值内存（Linux 上 ru_maxrss 单位为 KB），之后的单项测量
+    # 会把整段源帧读进内存，不能计入导出的峰值
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    result["peak_rss_mb"] = round(self_rss / 1024, 1)
+    result["peak_child_rss_mb"] = round(child_rss / 1024, 1)
+    frames = int(case["fps"] * case["duration"])
+    result["decode_fps"] = round(measure_decode(case["clip"], frames), 2)
+    result["transform_fps"] = round(
+        measure_transform(case["clip"], case["crop"], case["target_size"]), 2
+    )
+    return result
+
+
+def run_case_isolated(case):
+    """在子进程中运行用例，避免用例之间的内存峰值相互影响"""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case)],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1:] or ["未知错误"]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def build_cases(args):
+    cases = []
+    matrix = itertools.product(
+        args.resolutions, args.fps, args.durations, args.audio, args.crops
+    )
+    for resolution, fps, duration, audio, crop_name in matrix:
+        clip = synthetic_clip(args.clip_dir, resolution, fps, duration, audio)
+        width, height = RESOLUTIONS[resolution]
+        crop = crop_for(crop_name, width, height)
+        for target, engine in itertools.product(args.targets, args.engines):
+            target_size = (target, target) if target else None
+            key = (
+                f"{resolution}p{fps}_{duration}s_{'a' if audio else 'na'}"
+                f"/{crop_name}/{target or 'src'}/{engine}"
+            )
+            cases.append(
+                {
+                    "key": key,
+                    "clip": clip,
+                    "fps": fps,
+                    "duration": duration,
+                    "crop": crop,
+                    "target_size": target_size,
+                    "engine": engine,
+                }
+            )
+    return cases
+
+
+def compare(results, baseline, tolerance):
+    """与基线比较导出速度，返回退步的用例列表"""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get("results", {}).get(key)
+        if not old or "export_fps" not in old or "export_fps" not in result:
+            continue
+        ratio = result["export_fps"] / old["export_fps"] if old["export_fps"] else 1
+        result["vs_baseline"] = round(ratio, 3)
+        if ratio < 1 - tolerance:
+            regressions.append(key)
+    return regressions
+
+
+def int_list(text):
+    return [int(v) for v in text.split(",") if v]
+
+
+def str_list(text):
+    return [v for v in text.split(",") if v]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="裁切导出性能基准")
+    parser.add_argument("--resolutions", type=str_list, default=["480", "1080", "2160"])
+    parser.add_argument("--fps", type=int_list, default=[30])
+    parser.add_argument("--durations", type=int_list, default=[4], help="秒")
+    parser.add_argument(
+        "--audio",
+        type=lambda text: [v == "yes" for v in str_list(text)],
+        default=[True],
+        help="yes,no 表示有无音轨各测一遍",
+    )
+    parser.add_argument("--crops", type=str_list, default=["full", "half"])
+    parser.add_argument(
+        "--targets", type=int_list, default=[0, 480], help="输出边长，0 表示不缩放"
+    )
+    parser.add_argument("--engines", type=str_list, default=["opencv", "ffmpeg"])
+    parser.add_argument("--clip-dir", default=DEFAULT_CLIP_DIR)
+    parser.add_argument("-o", "--output", help="结果 JSON 路径")
+    parser.add_argument("--baseline", help="基线 JSON，用于对比")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="允许的速度下降比例"
+    )
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return 0
+
+    unknown = [r for r in args.resolutions if r not in RESOLUTIONS]
+    if unknown:
+        print(f"未知分辨率: {unknown}，可选 {sorted(RESOLUTIONS)}")
+        return 2
+
+    results = {}
+    for case in build_cases(args):
+        result = run_case_isolated(case)
+        results[case["key"]] = result
+        print(f"{case['key']}: {json.dumps(result, ensure_ascii=False)}")
+
+    report = {
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+        },
+        "results": results,
+    }
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+        for key in regressions:
+            print(f"[退步] {key}: {results[key]['vs_baseline']:.2f}x")
+        status = 1 if regressions else 0
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
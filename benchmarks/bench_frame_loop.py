@@ -0,0 +1,110 @@
+"""测量导出帧循环（encode_frames）的单帧耗时和内存占用
+
+解码用内存中的合成帧代替，编码器换成只接收数据的空管道，只测裁切/缩放/交给编码器
+这一段及流水线本身的开销，结果以 JSON 输出。
+
+示例:
+    python benchmarks/bench_frame_loop.py --size 3840x2160 --frames 600
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crop_engine import CropJob, encode_frames  # noqa: E402
+
+
+def current_rss_mb():
+    """当前进程常驻内存（MB），仅 Linux"""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+class MemoryCapture:
+    """模拟 cv2.VideoCapture：循环返回预先生成的帧，每次 read() 新分配一帧"""
+
+    def __init__(self, frames, count):
+        self.frames = frames
+        self.count = count
+        self.position = 0
+
+    def read(self, image=None):
+        if self.position >= self.count:
+            return False, None
+        frame = self.frames[self.position % len(self.frames)].copy()
+        self.position += 1
+        return True, frame
+
+
+class NullWriter:
+    """模拟 FFmpegPipeWriter：与真实写入端一样取连续内存，但不保存"""
+
+    def write(self, frame):
+        data = frame.data if frame.flags.c_contiguous else frame.tobytes()
+        return len(data)
+
+
+def measure(frames, crop, target_size, count):
+    """按帧完成时间计算间隔，每 10% 记录一次相对起始的 RSS 增量"""
+    h, w = frames[0].shape[:2]
+    job = CropJob("bench.mp4", "bench_out.mp4", crop, target_size)
+    info = {"width": w, "height": h, "frames": count}
+    rss_before = current_rss_mb()
+    checkpoint = max(1, count // 10)
+    stamps = [time.perf_counter()]
+    rss_curve = []
+
+    def on_frame(frame_count):
+        stamps.append(time.perf_counter())
+        if frame_count % checkpoint == 0:
+            rss_curve.append(round(current_rss_mb() - rss_before, 1))
+
+    encode_frames(
+        job, MemoryCapture(frames, count), info, crop, NullWriter(), on_frame=on_frame
+    )
+    latencies = sorted(b - a for a, b in zip(stamps, stamps[1:]))
+    return {
+        "frames": count,
+        "wall_time": round(stamps[-1] - stamps[0], 3),
+        "ms_per_frame_p50": round(latencies[len(latencies) // 2] * 1000, 3),
+        "ms_per_frame_p99": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        "rss_growth_mb": rss_curve,
+    }
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="裁切循环内存/耗时基准")
+    parser.add_argument("--size", type=parse_size, default=(3840, 2160))
+    parser.add_argument("--target", type=parse_size, default=(1080, 1080))
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args(argv)
+
+    w, h = args.size
+    side = min(w, h)
+    crop = ((w - side) // 2, 0, (w - side) // 2 + side, side)
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (h, w, 3), dtype=np.uint8) for _ in range(4)]
+
+    result = {
+        "source": f"{w}x{h}",
+        "target": f"{args.target[0]}x{args.target[1]}",
+        "crop_only": measure(frames, crop, None, args.frames),
+        "scaled": measure(frames, crop, args.target, args.frames),
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
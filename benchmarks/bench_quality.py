@@ -0,0 +1,229 @@
+"""质量/速度对照：对每种导出方式和编码配置测导出速度，并与源视频裁切逐帧对比 PSNR/SSIM
+
+默认使用 bench_export 的合成视频，也可以用 --inputs 指定真实素材；不需要网络。
+加上 --baseline 旧结果.json 时，速度下降超过 --tolerance、平均 PSNR 下降超过
+--psnr-tolerance 分贝或平均 SSIM 下降超过 --ssim-tolerance 的用例记为退步，返回非零退出码。
+
+示例:
+    python benchmarks/bench_quality.py -o quality.json
+    python benchmarks/bench_quality.py --engines opencv --profiles fast,archive --baseline quality.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+
+import cv2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import crop_engine  # noqa: E402
+import quality_metrics  # noqa: E402
+from bench_export import (  # noqa: E402
+    DEFAULT_CLIP_DIR,
+    RESOLUTIONS,
+    crop_for,
+    int_list,
+    str_list,
+    synthetic_clip,
+)
+from encoder_profiles import PROFILES  # noqa: E402
+
+
+def clip_size(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        return (
+            int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            cap.get(cv2.CAP_PROP_FPS) or 25.0,
+        )
+    finally:
+        cap.release()
+
+
+def build_cases(args):
+    clips = []
+    for resolution in args.resolutions:
+        path = synthetic_clip(args.clip_dir, resolution, 30, args.duration, False)
+        clips.append((f"{resolution}p", path))
+    for path in args.inputs:
+        clips.append((os.path.basename(path), path))
+
+    cases = []
+    for name, path in clips:
+        width, height, fps = clip_size(path)
+        crop = crop_for("half", width, height)
+        matrix = itertools.product(
+            args.targets, args.engines, args.profiles, args.segments
+        )
+        for target, engine, profile, segments in matrix:
+            # 原生引擎和多路/分段导出互斥
+            if engine == "ffmpeg" and segments > 1:
+                continue
+            cases.append(
+                {
+                    "key": f"{name}/{target or 'src'}/{engine}/{profile}/seg{segments}",
+                    "clip": path,
+                    "fps": fps,
+                    "crop": crop,
+                    "target_size": (target, target) if target else None,
+                    "engine": engine,
+                    "profile": profile,
+                    "segments": segments,
+                }
+            )
+    return cases
+
+
+def reference_crop(case):
+    """导出实际使用的裁切区域：原生引擎会把起点对齐到色度抽样边界"""
+    if case["engine"] != "ffmpeg":
+        return case["crop"]
+    pix_fmt = crop_engine.probe_pixel_format(case["clip"])
+    return crop_engine.align_crop_to_chroma(
+        case["crop"], crop_engine.chroma_subsampling(pix_fmt)
+    )
+
+
+def run_case(case, block):
+    with tempfile.TemporaryDirectory(prefix="crop_quality_") as out_dir:
+        output = os.path.join(out_dir, "out.mp4")
+        job = crop_engine.CropJob(
+            case["clip"],
+            output,
+            case["crop"],
+            case["target_size"],
+            engine=case["engine"],
+            segments=case["segments"],
+            encoder=PROFILES[case["profile"]],
+        )
+        stats = crop_engine.export_video(job)
+        quality = quality_metrics.compare_videos(
+            case["clip"], output, reference_crop(case), case["target_size"], block=block
+        )
+    duration = stats["frames"] / case["fps"] if case["fps"] else 0
+    return {
+        "export_fps": round(stats["fps"], 2),
+        "wall_time": round(stats["wall_time"], 3),
+        "output_kbps": (
+            round(stats["output_bytes"] * 8 / duration / 1000, 1) if duration else 0
+        ),
+        **quality,
+    }
+
+
+def compare(results, baseline, tolerance, psnr_tolerance, ssim_tolerance):
+    """与基线比较速度和质量，返回 [(用例, 原因)]"""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get("results", {}).get(key)
+        if not old or "error" in old or "error" in result:
+            continue
+        if old["export_fps"]:
+            ratio = result["export_fps"] / old["export_fps"]
+            result["vs_baseline"] = round(ratio, 3)
+            if ratio < 1 - tolerance:
+                regressions.append((key, f"速度 {ratio:.2f}x"))
+        psnr_drop = old["psnr_mean"] - result["psnr_mean"]
+        if psnr_drop > psnr_tolerance:
+            regressions.append((key, f"PSNR 下降 {psnr_drop:.2f} dB"))
+        ssim_drop = old["ssim_mean"] - result["ssim_mean"]
+        if ssim_drop > ssim_tolerance:
+            regressions.append((key, f"SSIM 下降 {ssim_drop:.4f}"))
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="导出方式与编码配置的质量/速度对照")
+    parser.add_argument("--resolutions", type=str_list, default=["480", "1080"])
+    parser.add_argument("--duration", type=int, default=4, help="合成视频时长（秒）")
+    parser.add_argument("--inputs", nargs="*", default=[], help="额外的真实素材")
+    parser.add_argument(
+        "--targets", type=int_list, default=[0, 480], help="输出边长，0 表示不缩放"
+    )
+    parser.add_argument("--engines", type=str_list, default=["opencv", "ffmpeg"])
+    parser.add_argument(
+        "--profiles", type=str_list, default=["default", "fast", "archive", "small"]
+    )
+    parser.add_argument("--segments", type=int_list, default=[1])
+    parser.add_argument("--block", type=int, default=16, help="批量对比的帧数")
+    parser.add_argument("--clip-dir", default=DEFAULT_CLIP_DIR)
+    parser.add_argument("-o", "--output", help="结果 JSON 路径")
+    parser.add_argument("--baseline", help="基线 JSON，用于对比")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="允许的速度下降比例"
+    )
+    parser.add_argument(
+        "--psnr-tolerance", type=float, default=0.5, help="允许的平均 PSNR 下降（dB）"
+    )
+    parser.add_argument(
+        "--ssim-tolerance", type=float, default=0.005, help="允许的平均 SSIM 下降"
+    )
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    unknown = [r for r in args.resolutions if r not in RESOLUTIONS]
+    unknown += [p for p in args.profiles if p not in PROFILES]
+    if unknown:
+        print(f"未知的分辨率或编码配置: {unknown}")
+        return 2
+
+    results = {}
+    for case in build_cases(args):
+        try:
+            result = run_case(case, args.block)
+        except Exception as e:
+            result = {"error": str(e)}
+        results[case["key"]] = result
+        if "error" in result:
+            print(f"{case['key']}: [失败] {result['error']}")
+            continue
+        print(
+            f"{case['key']}: {result['export_fps']:.1f} fps  "
+            f"{result['wall_time']:.2f} s  {result['output_kbps']:.0f} kbps  "
+            f"PSNR {result['psnr_mean']:.2f} dB (最低 {result['psnr_min']:.2f})  "
+            f"SSIM {result['ssim_mean']:.4f} (最低 {result['ssim_min']:.4f})"
+        )
+
+    report = {
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+        },
+        "results": results,
+    }
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(
+                results,
+                json.load(f),
+                args.tolerance,
+                args.psnr_tolerance,
+                args.ssim_tolerance,
+            )
+        report["regressions"] = [
+            {"key": key, "reason": reason} for key, reason in regressions
+        ]
+        for key, reason in regressions:
+            print(f"[退步] {key}: {reason}")
+        status = 1 if regressions else 0
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
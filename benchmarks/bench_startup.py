@@ -0,0 +1,169 @@
+"""启动性能基准：在全新的子进程中测量各入口模块的导入耗时、命令行 --help 和界面出窗时间
+
+每个用例重复运行 --repeat 次取中位数，同时记录导入后已被加载的重依赖（cv2、NumPy、
+PIL、moviepy），正常情况下它们应在第一次真正使用时才加载。界面用例需要图形环境，
+没有 DISPLAY 时跳过。加上 --baseline 旧结果.json 时，耗时增加超过 --tolerance
+或导入时新加载了重依赖的用例记为退步，返回非零退出码。
+
+示例:
+    python benchmarks/bench_startup.py -o startup.json
+    python benchmarks/bench_startup.py --repeat 11 --baseline startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "clip_video_tool",
+    "crop_engine",
+    "watch_folder",
+    "crop_cluster",
+    "auto_crop",
+]
+HEAVY_MODULES = ["cv2", "numpy", "PIL", "moviepy", "imageio"]
+# 子进程因缺少图形环境而跳过时的退出码
+SKIPPED = 3
+
+IMPORT_SCRIPT = """
+import json, sys
+import {module}
+print(json.dumps([name for name in {heavy!r} if name in sys.modules]))
+"""
+
+WINDOW_SCRIPT = """
+import sys, tkinter as tk
+try:
+    root = tk.Tk()
+except tk.TclError:
+    sys.exit({skipped})
+import clip_video_tool
+app = clip_video_tool.VideoCropperApp(root)
+root.update()
+root.destroy()
+"""
+
+
+def build_cases(args):
+    cases = [{"key": "python", "cmd": [sys.executable, "-c", "pass"]}]
+    for module in args.modules:
+        script = IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+        cases.append({"key": f"import/{module}", "cmd": [sys.executable, "-c", script]})
+    for script in ("crop_engine.py", "auto_crop.py"):
+        cases.append(
+            {"key": f"help/{script}", "cmd": [sys.executable, script, "--help"]}
+        )
+    if not args.no_gui:
+        script = WINDOW_SCRIPT.format(skipped=SKIPPED)
+        cases.append({"key": "gui/window", "cmd": [sys.executable, "-c", script]})
+    return cases
+
+
+def run_case(case, repeat):
+    """重复运行子进程，返回耗时统计；import 用例附带已加载的重依赖"""
+    times = []
+    heavy = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            case["cmd"], cwd=ROOT, capture_output=True, text=True, encoding="utf-8"
+        )
+        elapsed = time.perf_counter() - start
+        if result.returncode == SKIPPED and case["key"].startswith("gui/"):
+            return {"skipped": "没有图形环境"}
+        if result.returncode != 0:
+            lines = result.stderr.strip().splitlines()
+            return {"error": lines[-1] if lines else f"退出码 {result.returncode}"}
+        times.append(elapsed)
+        if case["key"].startswith("import/"):
+            heavy = json.loads(result.stdout.strip().splitlines()[-1])
+    result = {
+        "median_ms": round(statistics.median(times) * 1000, 1),
+        "min_ms": round(min(times) * 1000, 1),
+    }
+    if case["key"].startswith("import/"):
+        result["heavy_modules"] = heavy
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """与基线比较，返回 [(用例, 原因)]"""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get("results", {}).get(key)
+        if not old or "median_ms" not in old or "median_ms" not in result:
+            continue
+        ratio = result["median_ms"] / old["median_ms"]
+        result["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append((key, f"耗时 {ratio:.2f}x"))
+        added = set(result.get("heavy_modules", [])) - set(old.get("heavy_modules", []))
+        if added:
+            regressions.append((key, f"导入时加载了 {', '.join(sorted(added))}"))
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="导入耗时与启动时间基准")
+    parser.add_argument("--modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=7, help="每个用例的运行次数")
+    parser.add_argument("--no-gui", action="store_true", help="跳过界面出窗用例")
+    parser.add_argument("-o", "--output", help="结果 JSON 路径")
+    parser.add_argument("--baseline", help="基线 JSON，用于对比")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="允许的耗时增加比例"
+    )
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results = {}
+    for case in build_cases(args):
+        result = run_case(case, max(1, args.repeat))
+        results[case["key"]] = result
+        if "median_ms" not in result:
+            reason = result.get("skipped") or result.get("error")
+            print(f"{case['key']}: [跳过] {reason}")
+            continue
+        line = (
+            f"{case['key']}: {result['median_ms']:.1f} ms (最快 {result['min_ms']:.1f})"
+        )
+        if result.get("heavy_modules"):
+            line += f"  已加载: {', '.join(result['heavy_modules'])}"
+        print(line)
+
+    report = {
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report["regressions"] = [
+            {"key": key, "reason": reason} for key, reason in regressions
+        ]
+        for key, reason in regressions:
+            print(f"[退步] {key}: {reason}")
+        status = 1 if regressions else 0
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
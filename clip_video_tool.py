@@ -1,13 +1,34 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import cv2
-from PIL import Image, ImageTk
+import logging
 import os
-from moviepy.editor import VideoFileClip, AudioFileClip
-import tempfile
+import threading
+import time
+import auto_crop
+import crop_engine
+import proxy_cache
+from export_metrics import summary_bottleneck
+from output_cache import OutputCache
+from crop_track import CropTrack
+from frame_store import FrameStore
+from encoder_profiles import PROFILES, auto_tune
+from preview_source import PlaybackSource, PreviewSource
+from lazy_modules import LazyModule, preload
+
+Image = LazyModule("PIL.Image")
+ImageTk = LazyModule("PIL.ImageTk")
 
 
 class VideoCropperApp:
+    # 界面显示名到编码配置名
+    ENCODER_PROFILES = {
+        "默认": "default",
+        "快速出片": "fast",
+        "存档质量": "archive",
+        "小体积": "small",
+    }
+    AUTO_TUNE = "自动调优"
+
     def __init__(self, master):
         self.master = master
         master.title("视频裁切工具 v2.0")
@@ -32,6 +53,48 @@ class VideoCropperApp:
         self.start_y = 0
         self.width_var = tk.StringVar()
         self.height_var = tk.StringVar()
+        self.segment_var = tk.BooleanVar(value=False)
+        self.native_var = tk.BooleanVar(value=False)
+        self.resume_var = tk.BooleanVar(value=False)
+        self.profile_var = tk.StringVar(value="默认")
+        # 入点/出点，留空表示从头开始、到结尾结束
+        self.start_var = tk.StringVar()
+        self.end_var = tk.StringVar()
+        # 同一次解码额外输出的宽度，逗号分隔
+        self.extra_sizes_var = tk.StringVar()
+        self.progress_info = tk.StringVar(value="")
+        # 后台导出状态
+        self.export_thread = None
+        self.export_job = None
+        self.export_result = None
+        self.export_start = 0.0
+        self.progress_state = (0, 0)
+        self.cancel_event = threading.Event()
+        # 预览时间轴状态
+        self.preview_source = None
+        self.preview_input = None
+        self.proxy_builder = None
+        self.proxy_var = tk.BooleanVar(value=True)
+        # 相同输入和参数再次导出时直接复用结果
+        self.cache_var = tk.BooleanVar(value=True)
+        self.output_cache = OutputCache()
+        # 解码帧存储：导出时完整解码一次，之后的预览和导出直接读取内存映射
+        self.frame_store_var = tk.BooleanVar(value=False)
+        self.frame_store = FrameStore()
+        # 自动裁切分析结果（后台线程写入）
+        self.auto_crop_result = None
+        self.current_frame = 0
+        self.frame_var = tk.IntVar(value=0)
+        self.frame_info = tk.StringVar(value="")
+        # 动态裁切关键帧：帧号 -> 原始分辨率下的裁切框
+        self.keyframes = {}
+        self.keyframe_info = tk.StringVar(value="关键帧：0")
+        # 实时播放状态
+        self.player = None
+        self.play_job = None
+        self.show_cropped_var = tk.BooleanVar(value=False)
+        self.layout_size = (0, 0)
+        self.resize_job = None
         # 新增路径记忆属性
         # self.last_input_path = os.path.expanduser("~")  # 默认用户主目录
         # self.last_output_path = os.path.expanduser("~")
@@ -41,6 +104,7 @@ class VideoCropperApp:
         # 界面初始化
         self.create_widgets()
         self.bind_events()
+        self.canvas.bind("<Configure>", self.on_canvas_resize)
 
         # 窗口居中显示
         self.center_window()
@@ -109,6 +173,19 @@ class VideoCropperApp:
         self.reset_btn.pack(side=tk.LEFT, padx=5)
         self.lock_btn = tk.Button(btn_frame, text="锁定尺寸", command=self.toggle_lock)
         self.lock_btn.pack(side=tk.LEFT, padx=5)
+        self.auto_btn = tk.Button(
+            btn_frame, text="自动裁切", command=self.suggest_auto_crop
+        )
+        self.auto_btn.pack(side=tk.LEFT, padx=5)
+        tk.Checkbutton(btn_frame, text="代理预览", variable=self.proxy_var).pack(
+            side=tk.LEFT, padx=5
+        )
+        tk.Checkbutton(btn_frame, text="复用缓存", variable=self.cache_var).pack(
+            side=tk.LEFT, padx=5
+        )
+        tk.Checkbutton(btn_frame, text="解码缓存", variable=self.frame_store_var).pack(
+            side=tk.LEFT, padx=5
+        )
 
         # 输出尺寸区域
         size_frame = tk.Frame(self.master)
@@ -134,6 +211,43 @@ class VideoCropperApp:
         )
         self.height_combo.pack(side=tk.LEFT, padx=2)
         tk.Label(size_input_frame, text="px").pack(side=tk.LEFT)
+        tk.Label(size_input_frame, text="附加宽度:").pack(side=tk.LEFT, padx=(10, 0))
+        tk.Entry(size_input_frame, textvariable=self.extra_sizes_var, width=10).pack(
+            side=tk.LEFT, padx=2
+        )
+
+        # 时间范围
+        trim_frame = tk.Frame(size_frame)
+        trim_frame.pack(side=tk.LEFT, padx=10)
+        tk.Label(trim_frame, text="入点:").pack(side=tk.LEFT)
+        tk.Entry(trim_frame, textvariable=self.start_var, width=8).pack(side=tk.LEFT)
+        tk.Label(trim_frame, text="出点:").pack(side=tk.LEFT, padx=(5, 0))
+        tk.Entry(trim_frame, textvariable=self.end_var, width=8).pack(side=tk.LEFT)
+
+        # 分段并行导出（适合长视频）
+        tk.Checkbutton(size_frame, text="分段并行", variable=self.segment_var).pack(
+            side=tk.LEFT, padx=10
+        )
+
+        # 分段记录进度，中断后再次导出从断点继续
+        tk.Checkbutton(size_frame, text="断点续传", variable=self.resume_var).pack(
+            side=tk.LEFT, padx=10
+        )
+
+        # 由 ffmpeg 在 YUV 帧上直接裁切缩放
+        tk.Checkbutton(size_frame, text="原生YUV", variable=self.native_var).pack(
+            side=tk.LEFT, padx=10
+        )
+
+        # 编码配置，“自动调优”按实时速度为目标测试选择
+        tk.Label(size_frame, text="编码:").pack(side=tk.LEFT)
+        ttk.Combobox(
+            size_frame,
+            textvariable=self.profile_var,
+            values=list(self.ENCODER_PROFILES) + [self.AUTO_TUNE],
+            state="readonly",
+            width=8,
+        ).pack(side=tk.LEFT, padx=2)
 
         # 开始裁切按钮
         self.process_btn = tk.Button(
@@ -147,12 +261,66 @@ class VideoCropperApp:
         )
         self.canvas.grid(row=4, column=0, columnspan=3, padx=10, pady=10, sticky="nsew")
 
+        # 预览时间轴
+        timeline_frame = tk.Frame(self.master)
+        timeline_frame.grid(row=5, column=0, columnspan=3, padx=10, sticky="ew")
+        self.timeline = tk.Scale(
+            timeline_frame,
+            from_=0,
+            to=0,
+            orient=tk.HORIZONTAL,
+            variable=self.frame_var,
+            showvalue=False,
+            command=self.on_scrub,
+        )
+        self.play_btn = tk.Button(
+            timeline_frame, text="播放", width=5, command=self.toggle_playback
+        )
+        self.play_btn.pack(side=tk.LEFT, padx=5)
+        self.timeline.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        tk.Label(timeline_frame, textvariable=self.frame_info, width=24).pack(
+            side=tk.LEFT, padx=5
+        )
+        # 动态裁切：在不同时间点设置裁切框，导出时逐帧插值
+        tk.Button(timeline_frame, text="设为关键帧", command=self.add_keyframe).pack(
+            side=tk.LEFT, padx=5
+        )
+        tk.Button(timeline_frame, text="清除关键帧", command=self.clear_keyframes).pack(
+            side=tk.LEFT, padx=5
+        )
+        self.easing_combobox = ttk.Combobox(
+            timeline_frame, values=["线性", "缓动"], width=6, state="readonly"
+        )
+        self.easing_combobox.pack(side=tk.LEFT, padx=5)
+        self.easing_combobox.current(0)
+        tk.Label(timeline_frame, textvariable=self.keyframe_info, width=10).pack(
+            side=tk.LEFT, padx=5
+        )
+        tk.Checkbutton(
+            timeline_frame, text="播放裁切结果", variable=self.show_cropped_var
+        ).pack(side=tk.LEFT, padx=5)
+
+        # 导出进度区域
+        progress_frame = tk.Frame(self.master)
+        progress_frame.grid(row=6, column=0, columnspan=3, padx=10, pady=5, sticky="ew")
+        self.progress_bar = ttk.Progressbar(
+            progress_frame, orient=tk.HORIZONTAL, mode="determinate", maximum=100
+        )
+        self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        tk.Label(progress_frame, textvariable=self.progress_info, width=45).pack(
+            side=tk.LEFT, padx=5
+        )
+        self.cancel_btn = tk.Button(
+            progress_frame, text="取消", command=self.cancel_export, state=tk.DISABLED
+        )
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
+
         # 窗口尺寸适配
         self.master.columnconfigure(0, weight=1)
         self.master.rowconfigure(4, weight=1)
 
-    def get_target_size(self):
-        """智能尺寸计算"""
+    def get_target_size(self, crop_coords):
+        """智能尺寸计算，crop_coords 为决定输出比例的裁切框"""
         try:
             width = int(self.width_var.get()) if self.width_var.get() else 0
             height = int(self.height_var.get()) if self.height_var.get() else 0
@@ -160,30 +328,12 @@ class VideoCropperApp:
             messagebox.showerror("错误", "尺寸必须为整数")
             return None
 
-        # 正方形模式特殊处理
-        if self.mode_combobox.get() == "1:1 正方形":
-            valid_sizes = [s for s in [width, height] if s > 0]
-            if not valid_sizes:
-                return None
-            size = min(valid_sizes) if len(valid_sizes) > 1 else valid_sizes[0]
-            return (size, size)
-
-        # 自动比例计算
-        if not hasattr(self, "crop_coords") or not self.crop_coords:
-            return (width or None, height or None)
-
-        orig_width = self.crop_coords[2] - self.crop_coords[0]
-        orig_height = self.crop_coords[3] - self.crop_coords[1]
-
-        # 计算缺失的尺寸
-        if width <= 0 and height <= 0:
-            return None
-        if width <= 0:
-            width = int(height * orig_width / orig_height)
-        if height <= 0:
-            height = int(width * orig_height / orig_width)
-
-        return (max(1, width), max(1, height))
+        return crop_engine.compute_target_size(
+            crop_coords,
+            width,
+            height,
+            square=self.mode_combobox.get() == "1:1 正方形",
+        )
 
     def bind_events(self):
         """绑定画布事件"""
@@ -220,6 +370,54 @@ class VideoCropperApp:
             self.toggle_lock()  # 自动解除锁定
         self.show_preview()
 
+    def suggest_auto_crop(self):
+        """后台抽样分析当前视频，给出去黑边/活跃区域的建议裁切框"""
+        path = self.input_path.get()
+        if not os.path.exists(path):
+            messagebox.showerror("错误", "请先选择有效的输入视频")
+            return
+        if self.lock:
+            messagebox.showinfo("提示", "请先解锁尺寸")
+            return
+        square = self.mode_combobox.get() == "1:1 正方形"
+        self.auto_btn.config(state=tk.DISABLED)
+        self.size_info.set("正在分析画面...")
+        self.auto_crop_result = None
+        thread = threading.Thread(
+            target=self.run_auto_crop, args=(path, square), daemon=True
+        )
+        thread.start()
+        self.master.after(100, self.poll_auto_crop, thread, path)
+
+    def run_auto_crop(self, path, square):
+        """后台线程：只记录分析结果，不直接操作 Tk 控件"""
+        try:
+            self.auto_crop_result = auto_crop.analyse_video(path, square)
+        except Exception as e:
+            self.auto_crop_result = e
+
+    def poll_auto_crop(self, thread, path):
+        """分析完成后画出建议的裁切框，用户可以直接导出或重新绘制"""
+        if thread.is_alive():
+            self.master.after(100, self.poll_auto_crop, thread, path)
+            return
+        self.auto_btn.config(state=tk.NORMAL)
+        result = self.auto_crop_result
+        if isinstance(result, Exception):
+            self.size_info.set("尺寸：未选择")
+            messagebox.showerror("错误", f"自动裁切失败: {str(result)}")
+            return
+        if path != self.input_path.get():
+            return
+        self.crop_coords = tuple(result["crop"])
+        self.relayout_preview()
+        x1, y1, x2, y2 = self.crop_coords
+        if self.mode_combobox.get() == "1:1 正方形":
+            info = f"边长：{x2 - x1}像素"
+        else:
+            info = f"宽：{x2 - x1}像素 高：{y2 - y1}像素"
+        self.size_info.set(f"建议尺寸：{info}")
+
     def select_input(self):
         """智能路径选择与自动输出目录设置"""
         initial_dir = self._get_smart_initial_dir(
@@ -271,32 +469,95 @@ class VideoCropperApp:
             return last_path
         return os.path.expanduser("~")  # 默认回退到用户目录
 
+    def open_preview_source(self):
+        """输入路径变化时重新打开常驻的预览句柄，返回是否可用
+
+        启用解码缓存且该素材已解码时直接读取解码帧；否则大尺寸视频优先使用
+        已缓存的代理，没有代理时先用原片预览，同时在后台生成代理，完成后自动切换。
+        """
+        path = self.input_path.get()
+        if self.preview_source and self.preview_input == path:
+            return True
+        self.close_preview_source()
+        try:
+            original_size = proxy_cache.probe_video_size(path)
+            preview_path = path
+            stored = self.frame_store.open(path) if self.frame_store_var.get() else None
+            if stored is None and (
+                self.proxy_var.get() and proxy_cache.needs_proxy(original_size)
+            ):
+                proxy = proxy_cache.find_proxy(path)
+                if proxy:
+                    preview_path = proxy
+                else:
+                    self.proxy_builder = proxy_cache.ProxyBuilder(path).start()
+                    self.master.after(500, self.poll_proxy)
+            self.preview_source = PreviewSource(
+                preview_path, original_size=original_size, stored=stored
+            )
+        except (RuntimeError, OSError):
+            messagebox.showerror("错误", "无法读取视频")
+            return False
+        self.preview_input = path
+        self.original_size = original_size
+        self.clear_keyframes()
+        self.current_frame = 0
+        self.frame_var.set(0)
+        self.timeline.config(to=self.preview_source.frame_count - 1)
+        return True
+
+    def close_preview_source(self):
+        """释放预览句柄并取消未完成的代理生成"""
+        self.stop_playback()
+        if self.proxy_builder:
+            self.proxy_builder.cancel()
+            self.proxy_builder = None
+        if self.preview_source:
+            self.preview_source.close()
+            self.preview_source = None
+        self.preview_input = None
+
+    def poll_proxy(self):
+        """代理生成完成后把预览切换到代理，裁切框与坐标换算不受影响"""
+        builder = self.proxy_builder
+        if builder is None:
+            return
+        if not builder.done.is_set():
+            self.master.after(500, self.poll_proxy)
+            return
+        self.proxy_builder = None
+        if builder.error or builder.source_path != self.preview_input:
+            return
+        try:
+            proxy_source = PreviewSource(
+                builder.proxy_path, original_size=self.original_size
+            )
+        except RuntimeError:
+            return
+        self.preview_source.close()
+        self.preview_source = proxy_source
+        self.render_frame()
+
     def show_preview(self):
         """优化后的预览显示方法"""
         if not os.path.exists(self.input_path.get()):
             return
+        if not self.open_preview_source():
+            return
 
         # 清空画布并重置背景
+        self.stop_playback()
         self.canvas.delete("all")
         self.canvas.config(bg="#F0F0F0")  # 改为浅灰色背景
 
-        cap = cv2.VideoCapture(self.input_path.get())
-        ret, frame = cap.read()
-        if not ret:
-            messagebox.showerror("错误", "无法读取视频")
-            return
-
-        # 计算缩放后的显示尺寸
-        orig_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        orig_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        self.original_size = (orig_w, orig_h)
-
         # 计算保持比例的显示尺寸
+        orig_w, orig_h = self.original_size
         canvas_w = self.canvas.winfo_width()
         canvas_h = self.canvas.winfo_height()
+        self.layout_size = (canvas_w, canvas_h)
         ratio = min(canvas_w / orig_w, canvas_h / orig_h)
-        self.new_w = int(orig_w * ratio)
-        self.new_h = int(orig_h * ratio)
+        self.new_w = max(1, int(orig_w * ratio))
+        self.new_h = max(1, int(orig_h * ratio))
         self.scale_x = orig_w / self.new_w
         self.scale_y = orig_h / self.new_h
 
@@ -307,20 +568,200 @@ class VideoCropperApp:
         # 绘制预览边界框
         self.draw_preview_border()
 
-        # 转换并显示图像
-        resized = cv2.resize(frame, (self.new_w, self.new_h))
-        img = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-        self.preview_img = ImageTk.PhotoImage(Image.fromarray(img))
-
         # 创建图像对象并居中显示
         self.canvas.create_image(
             self.img_x,
             self.img_y,
             anchor=tk.NW,
-            image=self.preview_img,
             tags="video_preview",
         )
-        cap.release()
+        self.render_frame()
+
+    def render_frame(self):
+        """把当前帧画到预览图像上，优先使用缓存，不影响已绘制的裁切框"""
+        if not self.preview_source:
+            return
+        size = (self.new_w, self.new_h)
+        frame = self.preview_source.get_frame(self.current_frame, size)
+        if frame is None:
+            return
+        self.preview_img = ImageTk.PhotoImage(Image.fromarray(frame))
+        self.canvas.itemconfig("video_preview", image=self.preview_img)
+        self.preview_source.prefetch(self.current_frame)
+        self.update_frame_info()
+
+    def update_frame_info(self):
+        seconds = self.current_frame / self.preview_source.fps
+        self.frame_info.set(
+            f"{int(seconds // 60):02d}:{seconds % 60:05.2f}  第 {self.current_frame} 帧"
+        )
+
+    def toggle_playback(self):
+        """播放/暂停"""
+        if self.player:
+            self.stop_playback()
+            self.render_frame()
+        else:
+            self.start_playback()
+
+    def start_playback(self):
+        """从当前帧开始按源帧率播放，解码和缩放在后台线程中进行"""
+        if not self.preview_source:
+            return
+        size = (self.new_w, self.new_h)
+        crop_for = None
+        if self.show_cropped_var.get():
+            if not self.crop_coords:
+                messagebox.showerror("错误", "请先绘制裁切区域")
+                return
+            crop_for = self.crop_lookup()
+            # 裁切结果按比例放进预览区域并居中
+            x1, y1, x2, y2 = crop_for(self.current_frame)
+            ratio = min(self.new_w / (x2 - x1), self.new_h / (y2 - y1))
+            size = (max(1, int((x2 - x1) * ratio)), max(1, int((y2 - y1) * ratio)))
+            self.canvas.coords(
+                "video_preview",
+                self.img_x + (self.new_w - size[0]) // 2,
+                self.img_y + (self.new_h - size[1]) // 2,
+            )
+            if self.rect:
+                self.canvas.itemconfig(self.rect, state=tk.HIDDEN)
+        self.player = PlaybackSource(
+            self.preview_source.path,
+            self.current_frame,
+            size,
+            self.preview_source.fps,
+            original_size=self.original_size,
+            crop_for=crop_for,
+            stored=self.preview_source.stored,
+        ).start()
+        self.play_btn.config(text="暂停")
+        self.play_tick()
+
+    def crop_lookup(self):
+        """返回 帧号 -> 裁切框 的函数，供播放线程使用（不访问 Tk 控件）"""
+        track = self.get_crop_track()
+        frame_size = self.original_size
+        crop = self.crop_coords
+
+        def crop_for(index):
+            return track.crop_at(index, frame_size) if track else crop
+
+        return crop_for
+
+    def play_tick(self):
+        """显示此刻应显示的帧；界面来不及时跳过过期帧，只做贴图和更新时间轴"""
+        player = self.player
+        if player is None:
+            return
+        item = player.frame_due()
+        if item is not None:
+            index, image = item
+            self.preview_img = ImageTk.PhotoImage(Image.fromarray(image))
+            self.canvas.itemconfig("video_preview", image=self.preview_img)
+            # 先更新 current_frame，on_scrub 据此识别这是播放而不是拖动
+            self.current_frame = index
+            self.frame_var.set(index)
+            self.update_frame_info()
+            if self.keyframes and player.crop_for is None:
+                self.crop_coords = self.get_crop_track().crop_at(
+                    index, self.original_size
+                )
+                self.draw_crop_rect()
+        if player.finished:
+            self.stop_playback()
+            self.render_frame()
+            return
+        # 以半帧间隔轮询，减少显示时刻的抖动
+        delay = max(1, int(500 / player.fps))
+        self.play_job = self.master.after(delay, self.play_tick)
+
+    def stop_playback(self):
+        """停止播放，恢复整帧预览和裁切框"""
+        if self.play_job:
+            self.master.after_cancel(self.play_job)
+            self.play_job = None
+        if self.player is None:
+            return
+        cropped = self.player.crop_for is not None
+        self.player.stop()
+        self.player = None
+        self.play_btn.config(text="播放")
+        if cropped:
+            self.canvas.coords("video_preview", self.img_x, self.img_y)
+            if self.rect:
+                self.canvas.itemconfig(self.rect, state=tk.NORMAL)
+
+    def on_scrub(self, value):
+        """拖动时间轴：切换预览帧，有关键帧时显示该帧插值后的裁切框
+
+        播放中拖动时从新位置继续播放。
+        """
+        frame = int(float(value))
+        if self.player:
+            if frame == self.current_frame:
+                return
+            self.stop_playback()
+            self.current_frame = frame
+            self.start_playback()
+            return
+        self.current_frame = frame
+        self.render_frame()
+        if self.keyframes:
+            track = self.get_crop_track()
+            self.crop_coords = track.crop_at(self.current_frame, self.original_size)
+            self.draw_crop_rect()
+
+    def get_crop_track(self):
+        """由已设置的关键帧构造 CropTrack，没有关键帧时返回 None"""
+        if not self.keyframes:
+            return None
+        easing = "ease" if self.easing_combobox.get() == "缓动" else "linear"
+        return CropTrack(list(self.keyframes.items()), easing)
+
+    def add_keyframe(self):
+        """把当前裁切框记为当前帧的关键帧"""
+        if not self.crop_coords:
+            messagebox.showerror("错误", "请先绘制裁切区域")
+            return
+        self.keyframes[self.current_frame] = self.crop_coords
+        self.keyframe_info.set(f"关键帧：{len(self.keyframes)}")
+
+    def clear_keyframes(self):
+        """清除全部关键帧，恢复为静态裁切"""
+        self.keyframes = {}
+        self.keyframe_info.set("关键帧：0")
+
+    def on_canvas_resize(self, event):
+        """画布尺寸变化后重新布局（防抖），图像从缓存重新取"""
+        if not self.preview_source or (event.width, event.height) == self.layout_size:
+            return
+        if self.resize_job:
+            self.master.after_cancel(self.resize_job)
+        self.resize_job = self.master.after(150, self.relayout_preview)
+
+    def relayout_preview(self):
+        """按新的画布尺寸重绘预览，并按原始坐标恢复裁切框"""
+        self.resize_job = None
+        self.show_preview()
+        self.rect = None
+        self.draw_crop_rect()
+
+    def draw_crop_rect(self):
+        """按原始分辨率下的 crop_coords 在画布上画出（或移动）裁切框"""
+        if not self.crop_coords:
+            return
+        x1, y1, x2, y2 = self.crop_coords
+        coords = (
+            self.img_x + x1 / self.scale_x,
+            self.img_y + y1 / self.scale_y,
+            self.img_x + x2 / self.scale_x,
+            self.img_y + y2 / self.scale_y,
+        )
+        if self.rect and self.canvas.type(self.rect):
+            self.canvas.coords(self.rect, *coords)
+        else:
+            self.rect = self.canvas.create_rectangle(*coords, outline="red", width=2)
 
     def draw_preview_border(self):
         """绘制视频预览边界框"""
@@ -487,111 +928,150 @@ class VideoCropperApp:
                 int(max(x1, new_x2)),
                 int(max(y1, new_y2)),
             )
-        print(f"Debug - Final Crop Coords: {self.crop_coords}")  # 调试输出
+        logging.debug("裁切区域: %s", self.crop_coords)
 
     def process_video(self):
+        if self.export_thread and self.export_thread.is_alive():
+            return
         if not self.validate_inputs():
             return
 
-        # 创建临时目录
-        temp_dir = tempfile.mkdtemp()
-        temp_video_path = os.path.join(temp_dir, "temp_video.mp4")
-
-        try:
-            # 处理视频（无音频版本）
-            self.process_video_without_audio(temp_video_path)
-
-            # 合并音频
-            final_path = self.add_audio_to_video(temp_video_path)
-
-            messagebox.showinfo("完成", f"视频已保存至:\n{final_path}")
-        except Exception as e:
-            messagebox.showerror("错误", f"处理失败: {str(e)}")
-        finally:
-            # 清理临时文件
-            if os.path.exists(temp_dir):
-                for f in os.listdir(temp_dir):
-                    os.remove(os.path.join(temp_dir, f))
-                os.rmdir(temp_dir)
-
-    def process_video_without_audio(self, output_path):
-        """修复视频流处理逻辑"""
-        x1, y1, x2, y2 = self.crop_coords
-        target_size = self.get_target_size()
-
-        cap = cv2.VideoCapture(self.input_path.get())
-        if not cap.isOpened():
-            raise RuntimeError("无法打开视频文件")
-
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        # 动态裁切的输出尺寸由第一个关键帧决定，与播放头处插值出的裁切框无关
+        crop_track = self.get_crop_track()
+        crop_coords = crop_track.first_crop if crop_track else self.crop_coords
+        self.export_job = crop_engine.CropJob(
+            self.input_path.get(),
+            crop_engine.default_output_path(
+                self.input_path.get(), self.output_path.get()
+            ),
+            crop_coords,
+            self.get_target_size(crop_coords),
+            extra_outputs=self.get_extra_outputs(),
+            engine="ffmpeg" if self.native_var.get() else "opencv",
+            crop_track=crop_track,
+            segments=(os.cpu_count() or 1) if self.segment_var.get() else 1,
+            resumable=self.resume_var.get(),
+            start_time=crop_engine.parse_time(self.start_var.get()),
+            end_time=crop_engine.parse_time(self.end_var.get()),
+            frame_store=self.frame_store if self.frame_store_var.get() else None,
+            encoder=PROFILES[
+                self.ENCODER_PROFILES.get(self.profile_var.get(), "default")
+            ],
+        )
 
-        # 正确设置视频编码参数
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        final_size = target_size if target_size else (x2 - x1, y2 - y1)
-        out = cv2.VideoWriter(output_path, fourcc, fps, final_size)
+        # 在后台线程中导出，界面保持响应
+        self.cancel_event.clear()
+        self.export_result = None
+        self.progress_state = (0, 0)
+        self.export_start = time.perf_counter()
+        self.progress_bar["value"] = 0
+        self.progress_info.set("正在准备...")
+        self.process_btn.config(state=tk.DISABLED)
+        self.cancel_btn.config(state=tk.NORMAL)
+        # 自动调优以源视频帧率为速度目标，即编码不慢于实时播放
+        tune_fps = None
+        if self.profile_var.get() == self.AUTO_TUNE and self.preview_source:
+            tune_fps = self.preview_source.fps
+            self.progress_info.set("正在测试编码参数...")
+        self.export_thread = threading.Thread(
+            target=self.run_export, args=(self.export_job, tune_fps), daemon=True
+        )
+        self.export_thread.start()
+        self.master.after(100, self.poll_export)
+
+    def get_extra_outputs(self):
+        """根据“附加宽度”生成同一裁切区域的其他尺寸输出"""
+        square = self.mode_combobox.get() == "1:1 正方形"
+        specs = []
+        for text in self.extra_sizes_var.get().replace("，", ",").split(","):
+            if not text.strip():
+                continue
+            size = crop_engine.compute_target_size(
+                self.crop_coords, int(text), 0, square
+            )
+            path = crop_engine.default_output_path(
+                self.input_path.get(), self.output_path.get(), f"{size[0]}x{size[1]}"
+            )
+            specs.append(crop_engine.OutputSpec(self.crop_coords, size, path))
+        return specs
 
+    def run_export(self, job, tune_fps=None):
+        """后台线程：执行导出并记录结果，不直接操作 Tk 控件"""
         try:
-            frame_count = 0
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                # 执行裁切和缩放
-                cropped = frame[y1:y2, x1:x2]
-                if target_size:
-                    cropped = cv2.resize(cropped, target_size)
-
-                # 写入处理后的帧
-                out.write(cropped)
-                frame_count += 1
-
-                # 进度显示（可选）
-                if frame_count % 10 == 0:
-                    print(f"处理进度: {frame_count}/{total_frames} 帧")
-
+            if tune_fps:
+                job.encoder, job.threads = auto_tune(
+                    job.input_path, job.crop_coords, job.target_size, tune_fps
+                )
+            self.export_result = crop_engine.export_video(
+                job,
+                progress=self.record_progress,
+                cancel_event=self.cancel_event,
+                cache=self.output_cache if self.cache_var.get() else None,
+            )
         except Exception as e:
-            raise RuntimeError(f"视频处理失败: {str(e)}")
-        finally:
-            # 确保在最后释放资源
-            cap.release()
-            out.release()
-            print("视频流资源已释放")
-
-    def add_audio_to_video(self, video_path):
-        """优化音视频合并逻辑"""
-        final_path = os.path.join(
-            self.output_path.get(), f"cropped_{os.path.basename(self.input_path.get())}"
-        )
+            self.export_result = e
+
+    def record_progress(self, frame_count, total_frames):
+        """后台线程回调：只记录进度，由主线程定时刷新显示"""
+        self.progress_state = (frame_count, total_frames)
+
+    def cancel_export(self):
+        """请求取消当前导出"""
+        self.cancel_event.set()
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.progress_info.set("正在取消...")
+
+    def poll_export(self):
+        """主线程定时刷新进度，导出结束后提示结果"""
+        if self.export_thread.is_alive():
+            self.update_progress()
+            self.master.after(100, self.poll_export)
+            return
 
-        try:
-            # 加载原始视频信息
-            original_clip = VideoFileClip(self.input_path.get())
-            video_clip = VideoFileClip(video_path)
-
-            # 同步时间信息
-            if original_clip.audio is not None:
-                # 保持音频与视频时长一致
-                audio_clip = original_clip.audio.subclip(0, video_clip.duration)
-                final_clip = video_clip.set_audio(audio_clip)
+        self.process_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
+        result = self.export_result
+        if isinstance(result, crop_engine.ExportCancelled):
+            self.progress_bar["value"] = 0
+            if self.export_job.resumable:
+                self.progress_info.set("已取消，再次导出将从断点继续")
             else:
-                final_clip = video_clip
-
-            # 优化输出参数
-            final_clip.write_videofile(
-                final_path,
-                codec="libx264",
-                audio_codec="aac",
-                ffmpeg_params=["-movflags", "faststart"],  # 优化网络播放
-                threads=4,  # 使用多线程加速
+                self.progress_info.set("已取消")
+        elif isinstance(result, Exception):
+            self.progress_info.set("处理失败")
+            messagebox.showerror("错误", f"处理失败: {str(result)}")
+        else:
+            self.progress_bar["value"] = 100
+            if result.get("cached"):
+                self.progress_info.set(f"完成：复用缓存结果，{result['frames']} 帧")
+                messagebox.showinfo("完成", f"视频已保存至:\n{result['output']}")
+                return
+            self.progress_info.set(
+                f"完成：{result['frames']} 帧  {result['fps']:.1f} fps  "
+                f"{result['wall_time']:.1f} 秒  "
+                f"瓶颈: {summary_bottleneck(result['metrics']) or '-'}"
             )
-            return final_path
-        except Exception as e:
-            # 异常处理优化
-            error_msg = f"音视频合并失败: {str(e)}\n已保存中间文件: {video_path}"
-            messagebox.showwarning("警告", error_msg)
-            return video_path
+            messagebox.showinfo("完成", f"视频已保存至:\n{result['output']}")
+
+    def update_progress(self):
+        """根据已处理帧数计算进度、速度、剩余时间和已写入大小"""
+        frame_count, total_frames = self.progress_state
+        elapsed = time.perf_counter() - self.export_start
+        fps = frame_count / elapsed if elapsed > 0 else 0.0
+        if total_frames > 0:
+            self.progress_bar["value"] = min(100, frame_count * 100 / total_frames)
+        eta = (total_frames - frame_count) / fps if fps > 0 else 0.0
+        output_path = self.export_job.output_path
+        try:
+            written = os.path.getsize(output_path)
+        except OSError:
+            written = 0
+        if self.cancel_event.is_set():
+            return
+        self.progress_info.set(
+            f"{frame_count}/{total_frames} 帧  {fps:.1f} fps  "
+            f"剩余 {max(0, eta):.0f} 秒  {written / 1024 / 1024:.1f} MB"
+        )
 
     def validate_inputs(self):
         """验证输入合法性"""
@@ -612,8 +1092,28 @@ class VideoCropperApp:
                 int(self.width_var.get())
             if self.height_var.get():
                 int(self.height_var.get())
+            for text in self.extra_sizes_var.get().replace("，", ",").split(","):
+                if text.strip() and int(text) <= 0:
+                    raise ValueError(text)
         except ValueError:
             errors.append("输出尺寸必须为整数")
+        try:
+            start = crop_engine.parse_time(self.start_var.get())
+            end = crop_engine.parse_time(self.end_var.get())
+            if end is not None and end <= (start or 0):
+                errors.append("出点必须晚于入点")
+        except ValueError:
+            errors.append("入点/出点格式应为 秒数 或 分:秒")
+        if self.keyframes:
+            if self.extra_sizes_var.get().strip():
+                errors.append("动态裁切暂不支持附加尺寸")
+            if self.native_var.get():
+                errors.append("动态裁切暂不支持原生YUV")
+        if self.segment_var.get() or self.resume_var.get():
+            if self.extra_sizes_var.get().strip():
+                errors.append("分段并行/断点续传模式暂不支持附加尺寸")
+            if self.native_var.get():
+                errors.append("分段并行/断点续传模式暂不支持原生YUV")
         if errors:
             messagebox.showerror("输入错误", "\n".join(errors))
             return False
@@ -623,4 +1123,6 @@ class VideoCropperApp:
 if __name__ == "__main__":
     root = tk.Tk()
     app = VideoCropperApp(root)
+    # 窗口显示后在后台导入解码和预览用到的模块，首次打开视频时不必再等待
+    root.after_idle(preload, ("numpy", "cv2", "PIL.ImageTk"))
     root.mainloop()
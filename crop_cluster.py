@@ -0,0 +1,563 @@
+"""多机分布式导出：协调器分发任务，工作进程拉取任务并在本机导出
+
+协议为 HTTP + JSON，只用标准库，输入/输出路径需位于各机器都能访问的共享存储：
+
+    POST /lease      {"worker"}  -> {"lease", "lease_seconds", "job"} 或 {"job": null, "finished"}
+    POST /heartbeat  {"worker", "lease", "frames", "total"}  -> 200；租约已失效时 409，工作进程应取消导出
+    POST /complete   {"worker", "lease", "result"}
+    POST /fail       {"worker", "lease", "error"}
+    POST /jobs       {"jobs": [CropJob.to_spec(), ...]}
+    GET  /status     任务计数、总吞吐量和各工作进程统计
+
+租约在 lease_seconds 内没有心跳，或编码阶段（已写入帧数在 0 和总帧数之间）帧数超过
+stall_seconds 没有增加（如 ffmpeg 管道阻塞），即视为卡住，任务重新排队，原工作进程的
+下一次心跳收到 409 后放弃导出。打开文件、生成解码帧存储、等待缓存锁和拼接封装期间
+不汇报帧数，只要心跳正常就不算停滞。失败的任务也会重新排队，超过 max_attempts 次后标记为失败。
+
+每个租约先导出到输出旁带租约标记的临时文件，完成后才改名为最终路径，
+被回收租约的工作进程清理时不会删除新租约正在写入的输出。
+
+示例（同一台机器上一个协调器、多个工作进程）:
+    python crop_cluster.py coordinator "共享/素材/*.mp4" --crop 420,0,1500,1080 -o 共享/输出
+    python crop_cluster.py worker http://127.0.0.1:8765   # 每个工作进程一条命令
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crop_engine import (
+    CropJob,
+    ExportCancelled,
+    build_jobs,
+    build_parser,
+    export_video,
+    format_stages,
+    remove_partial_output,
+    resume_dir_for,
+)
+from export_metrics import ExportMetrics
+from output_cache import OutputCache
+
+DEFAULT_PORT = 8765
+# 没有心跳超过该时长的租约视为卡住
+LEASE_SECONDS = 30.0
+# 帧数不再增加超过租约时长的该倍数视为导出卡住
+STALL_LEASES = 4
+# 同一任务最多分配的次数
+MAX_ATTEMPTS = 3
+# 全部任务结束后继续应答的时长，让空闲的工作进程收到 finished 后退出
+LINGER_SECONDS = 5.0
+# 工作进程无任务时的轮询间隔
+POLL_SECONDS = 2.0
+# 上报完成/失败的重试次数，间隔从 1 秒起逐次加倍
+REPORT_ATTEMPTS = 6
+# crop_engine 中只在本机执行时有意义的选项，协调器不接受
+LOCAL_ONLY_OPTIONS = {
+    "jobs": "--jobs",
+    "metrics_jsonl": "--metrics-jsonl",
+    "cache": "--cache",
+    "cache_dir": "--cache-dir",
+    "cache_size_mb": "--cache-size-mb",
+}
+
+
+class Coordinator:
+    """任务表和租约，所有方法线程安全（由 HTTP 处理线程并发调用）"""
+
+    def __init__(
+        self,
+        lease_seconds=LEASE_SECONDS,
+        max_attempts=MAX_ATTEMPTS,
+        keep_running=False,
+        stall_seconds=None,
+    ):
+        self.lease_seconds = lease_seconds
+        self.stall_seconds = stall_seconds or lease_seconds * STALL_LEASES
+        self.max_attempts = max_attempts
+        # 为 True 时任务全部结束后仍等待通过 /jobs 提交新任务
+        self.keep_running = keep_running
+        self.started = time.time()
+        self.jobs = {}
+        self.pending = deque()
+        # {租约: {"job", "worker", "deadline", "frames", "advanced"}}，advanced 为帧数最近一次增加的时间
+        self.leases = {}
+        self.workers = {}
+        self._lock = threading.Lock()
+
+    def add_jobs(self, specs):
+        with self._lock:
+            for spec in specs:
+                job_id = len(self.jobs) + 1
+                self.jobs[job_id] = {
+                    "spec": spec,
+                    "state": "queued",
+                    "attempts": 0,
+                    "frames": 0,
+                    "error": None,
+                    "result": None,
+                }
+                self.pending.append(job_id)
+            return len(specs)
+
+    def _worker(self, name):
+        worker = self.workers.setdefault(
+            name, {"jobs": 0, "failed": 0, "frames": 0, "busy_seconds": 0.0}
+        )
+        worker["last_seen"] = time.time()
+        return worker
+
+    def lease(self, worker_name):
+        with self._lock:
+            self._worker(worker_name)
+            if not self.pending:
+                return {"job": None, "finished": self.finished}
+            job_id = self.pending.popleft()
+            job = self.jobs[job_id]
+            job["state"] = "running"
+            job["attempts"] += 1
+            job["worker"] = worker_name
+            job["leased_at"] = time.time()
+            token = uuid.uuid4().hex
+            now = time.time()
+            self.leases[token] = {
+                "job": job_id,
+                "worker": worker_name,
+                "deadline": now + self.lease_seconds,
+                "frames": 0,
+                "advanced": now,
+            }
+            return {
+                "lease": token,
+                "lease_seconds": self.lease_seconds,
+                "job": job["spec"],
+                "id": job_id,
+            }
+
+    def heartbeat(self, worker_name, token, frames, total=0):
+        """延长租约并记录进度，租约已失效时返回 False
+
+        只有编码阶段（0 < frames < total）帧数不增加才计入停滞，其余阶段没有帧数可报。
+        """
+        with self._lock:
+            self._worker(worker_name)
+            lease = self.leases.get(token)
+            if lease is None:
+                return False
+            now = time.time()
+            lease["deadline"] = now + self.lease_seconds
+            if frames > lease["frames"] or not 0 < frames < total:
+                lease["frames"] = max(lease["frames"], frames)
+                lease["advanced"] = now
+            self.jobs[lease["job"]]["frames"] = frames
+            return True
+
+    def complete(self, worker_name, token, result):
+        with self._lock:
+            worker = self._worker(worker_name)
+            lease = self.leases.pop(token, None)
+            if lease is None:
+                return False
+            job = self.jobs[lease["job"]]
+            job["state"] = "done"
+            job["result"] = result
+            job["frames"] = result.get("frames", job["frames"])
+            worker["jobs"] += 1
+            worker["frames"] += job["frames"]
+            worker["busy_seconds"] += time.time() - job["leased_at"]
+            return True
+
+    def fail(self, worker_name, token, error):
+        with self._lock:
+            worker = self._worker(worker_name)
+            lease = self.leases.pop(token, None)
+            if lease is None:
+                return False
+            worker["failed"] += 1
+            job_id = lease["job"]
+            worker["busy_seconds"] += time.time() - self.jobs[job_id]["leased_at"]
+            self._retry(job_id, error)
+            return True
+
+    def _retry(self, job_id, error):
+        job = self.jobs[job_id]
+        job["error"] = error
+        job["frames"] = 0
+        if job["attempts"] >= self.max_attempts:
+            job["state"] = "failed"
+            print(f"[失败] {job['spec']['input_path']}: {error}")
+        else:
+            job["state"] = "queued"
+            self.pending.append(job_id)
+            print(f"[重试] {job['spec']['input_path']}: {error}")
+
+    def expire_leases(self):
+        """回收心跳超时或进度停滞的租约，返回重新排队（或最终失败）的任务数
+
+        被回收的租约从表中删除，原工作进程的下一次心跳返回 False 并取消导出。
+        """
+        now = time.time()
+        with self._lock:
+            expired = []
+            for token, lease in self.leases.items():
+                if lease["deadline"] < now:
+                    expired.append((token, "心跳超时"))
+                elif now - lease["advanced"] > self.stall_seconds:
+                    expired.append(
+                        (token, f"{self.stall_seconds:g} 秒内没有导出新的帧")
+                    )
+            for token, reason in expired:
+                lease = self.leases.pop(token)
+                self._retry(lease["job"], f"工作进程 {lease['worker']} {reason}")
+            return len(expired)
+
+    @property
+    def finished(self):
+        """全部任务已结束（调用方持有锁）"""
+        if self.keep_running:
+            return False
+        return all(job["state"] in ("done", "failed") for job in self.jobs.values())
+
+    def status(self):
+        with self._lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job["state"]] = counts.get(job["state"], 0) + 1
+            frames = sum(job["frames"] for job in self.jobs.values())
+            elapsed = time.time() - self.started
+            workers = {}
+            for name, worker in self.workers.items():
+                busy = worker["busy_seconds"]
+                workers[name] = {
+                    **worker,
+                    "fps": round(worker["frames"] / busy, 2) if busy > 0 else 0.0,
+                }
+            return {
+                "jobs": counts,
+                "frames": frames,
+                "elapsed": round(elapsed, 2),
+                "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+                "finished": self.finished,
+                "workers": workers,
+            }
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    coordinator = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self.send_json(self.coordinator.status())
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json({"error": "invalid json"}, 400)
+            return
+        coordinator = self.coordinator
+        worker = request.get("worker", self.client_address[0])
+        if self.path == "/lease":
+            self.send_json(coordinator.lease(worker))
+        elif self.path == "/heartbeat":
+            ok = coordinator.heartbeat(
+                worker,
+                request["lease"],
+                request.get("frames", 0),
+                request.get("total", 0),
+            )
+            self.send_json({"ok": ok}, 200 if ok else 409)
+        elif self.path == "/complete":
+            ok = coordinator.complete(worker, request["lease"], request["result"])
+            self.send_json({"ok": ok}, 200 if ok else 409)
+        elif self.path == "/fail":
+            ok = coordinator.fail(worker, request["lease"], request.get("error", ""))
+            self.send_json({"ok": ok}, 200 if ok else 409)
+        elif self.path == "/jobs":
+            self.send_json({"added": coordinator.add_jobs(request.get("jobs", []))})
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+
+def serve(coordinator, host="127.0.0.1", port=DEFAULT_PORT, report_seconds=10.0):
+    """运行协调器直到全部任务结束（keep_running 时一直运行），返回最终状态"""
+    handler = type("Handler", (CoordinatorHandler,), {"coordinator": coordinator})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(
+        f"[协调器] http://{host}:{server.server_address[1]}  {len(coordinator.jobs)} 个任务"
+    )
+    last_report = time.monotonic()
+    try:
+        while True:
+            time.sleep(1.0)
+            coordinator.expire_leases()
+            status = coordinator.status()
+            if time.monotonic() - last_report >= report_seconds:
+                last_report = time.monotonic()
+                print(f"[进度] {format_status(status)}")
+            if status["finished"]:
+                time.sleep(LINGER_SECONDS)
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+    return coordinator.status()
+
+
+def format_status(status):
+    counts = status["jobs"]
+    return (
+        f"完成 {counts.get('done', 0)}  运行 {counts.get('running', 0)}  "
+        f"等待 {counts.get('queued', 0)}  失败 {counts.get('failed', 0)}  "
+        f"{status['frames']} 帧  {status['fps']:.1f} fps  "
+        f"{len(status['workers'])} 个工作进程"
+    )
+
+
+def post_json(url, payload, timeout=30):
+    """POST JSON 并返回 (状态码, 应答)"""
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    request = urllib.request.Request(
+        url, data=data, headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def lease_outputs(spec, token):
+    """把任务的输出路径换成租约专用的临时路径，返回 (CropJob, [(临时路径, 最终路径)])
+
+    临时路径保留扩展名，封装格式和音频处理方式与最终路径一致。
+    """
+    spec = json.loads(json.dumps(spec))
+    tag = token[:12]
+
+    def temp_path(path):
+        root, ext = os.path.splitext(path)
+        return f"{root}.lease-{tag}{ext}"
+
+    renames = [(temp_path(spec["output_path"]), spec["output_path"])]
+    spec["output_path"] = renames[0][0]
+    for extra in spec["extra_outputs"]:
+        renames.append((temp_path(extra[2]), extra[2]))
+        extra[2] = renames[-1][0]
+    return CropJob.from_spec(spec), renames
+
+
+def discard_outputs(renames):
+    """删除本租约的临时输出和续传分段目录"""
+    for temp_path, _ in renames:
+        remove_partial_output(temp_path)
+        shutil.rmtree(resume_dir_for(temp_path), ignore_errors=True)
+
+
+class Worker:
+    """从协调器拉取任务并逐个导出，导出期间按租约时长的 1/3 发送心跳"""
+
+    def __init__(self, url, name=None, cache=None):
+        self.url = url.rstrip("/")
+        self.name = name or f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+        self.cache = cache
+        self.frames = 0
+        self.total = 0
+
+    def call(self, endpoint, **payload):
+        return post_json(f"{self.url}/{endpoint}", {"worker": self.name, **payload})
+
+    def report(self, endpoint, **payload):
+        """上报完成或失败，协调器暂时不可达时退避重试，最终失败只记录日志
+
+        没有送达的结果由协调器在租约超时后重新排队。
+        """
+        delay = 1.0
+        for attempt in range(1, REPORT_ATTEMPTS + 1):
+            try:
+                return self.call(endpoint, **payload)
+            except OSError as e:
+                if attempt == REPORT_ATTEMPTS:
+                    print(f"[{self.name}] 无法向协调器上报 {endpoint}: {e}")
+                    return None
+                time.sleep(delay)
+                delay *= 2
+
+    def run(self, retry_seconds=60.0):
+        """循环拉取任务，协调器报告全部结束（或连接失败超过 retry_seconds）时返回"""
+        unreachable_since = None
+        while True:
+            try:
+                _, reply = self.call("lease")
+            except OSError:
+                unreachable_since = unreachable_since or time.monotonic()
+                if time.monotonic() - unreachable_since > retry_seconds:
+                    print(f"[{self.name}] 无法连接协调器，退出")
+                    return
+                time.sleep(POLL_SECONDS)
+                continue
+            unreachable_since = None
+            if reply.get("job") is None:
+                if reply.get("finished"):
+                    return
+                time.sleep(POLL_SECONDS)
+                continue
+            self.run_job(
+                reply["lease"],
+                reply["job"],
+                reply.get("lease_seconds", LEASE_SECONDS) / 3,
+            )
+
+    def run_job(self, token, spec, heartbeat_seconds):
+        job, renames = lease_outputs(spec, token)
+        cancel_event = threading.Event()
+        done = threading.Event()
+        self.frames = 0
+        self.total = 0
+
+        def record_progress(frame_count, total_frames):
+            self.frames = frame_count
+            self.total = total_frames
+
+        def heartbeat():
+            while not done.wait(heartbeat_seconds):
+                try:
+                    status, _ = self.call(
+                        "heartbeat", lease=token, frames=self.frames, total=self.total
+                    )
+                except OSError:
+                    continue
+                if status == 409:
+                    # 租约已被回收并交给其他工作进程
+                    cancel_event.set()
+                    return
+
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        print(f"[{self.name}] 开始 {job.input_path}")
+        try:
+            result = export_video(
+                job,
+                progress=record_progress,
+                cancel_event=cancel_event,
+                metrics=ExportMetrics(job_id=spec["output_path"]),
+                cache=self.cache,
+            )
+            for temp_path, final_path in renames:
+                os.replace(temp_path, final_path)
+        except ExportCancelled:
+            discard_outputs(renames)
+            print(f"[{self.name}] 租约失效，已放弃 {job.input_path}")
+            return
+        except Exception as e:
+            discard_outputs(renames)
+            print(f"[{self.name}] 失败 {job.input_path}: {e}")
+            self.report("fail", lease=token, error=str(e))
+            return
+        finally:
+            done.set()
+            beat.join()
+        finals = dict(renames)
+        result["output"] = finals.get(result["output"], result["output"])
+        if "outputs" in result:
+            result["outputs"] = [finals.get(p, p) for p in result["outputs"]]
+        print(
+            f"[{self.name}] 完成 {result['output']}  {result['frames']} 帧  "
+            f"{result['fps']:.1f} fps"
+        )
+        print(f"       {format_stages(result['metrics'])}")
+        self.report("complete", lease=token, result=result)
+
+
+def coordinator_main(argv):
+    parser = build_parser()
+    parser.prog = "crop_cluster.py coordinator"
+    parser.description = "分发裁切任务给工作进程（任务参数与 crop_engine.py 相同）"
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+    parser.add_argument(
+        "--stall-seconds",
+        type=float,
+        help=f"导出帧数不再增加超过该时长即重新分配，默认为租约时长的 {STALL_LEASES} 倍",
+    )
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    parser.add_argument(
+        "--keep-running",
+        action="store_true",
+        help="任务全部结束后继续运行，等待通过 POST /jobs 提交新任务",
+    )
+    args = parser.parse_args(argv)
+    given = [
+        flag
+        for dest, flag in LOCAL_ONLY_OPTIONS.items()
+        if getattr(args, dest) != parser.get_default(dest)
+    ]
+    if given:
+        parser.error(
+            f"协调器不支持 {', '.join(given)}：并发由工作进程数量决定，"
+            "缓存请在工作进程上用 --cache-dir 启用"
+        )
+    jobs, _, failed = build_jobs(parser, args)
+    coordinator = Coordinator(
+        args.lease_seconds, args.max_attempts, args.keep_running, args.stall_seconds
+    )
+    coordinator.add_jobs([job.to_spec() for job in jobs])
+    status = serve(coordinator, args.host, args.port)
+    print(f"[结束] {format_status(status)}")
+    return 1 if failed or status["jobs"].get("failed") else 0
+
+
+def worker_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="crop_cluster.py worker", description="从协调器拉取任务并导出"
+    )
+    parser.add_argument("url", help="协调器地址，如 http://127.0.0.1:8765")
+    parser.add_argument("--name", help="工作进程名称，默认为主机名加随机后缀")
+    parser.add_argument("--cache-dir", help="导出缓存目录（指定即启用缓存）")
+    args = parser.parse_args(argv)
+    cache = OutputCache(args.cache_dir) if args.cache_dir else None
+    Worker(args.url, args.name, cache).run()
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["coordinator"]:
+        return coordinator_main(argv[1:])
+    if argv[:1] == ["worker"]:
+        return worker_main(argv[1:])
+    print("用法: crop_cluster.py coordinator ... | crop_cluster.py worker URL")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
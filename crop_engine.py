@@ -0,0 +1,1791 @@
+"""视频裁切导出核心，不依赖 tkinter，可在服务器上批量运行
+
+示例:
+    python crop_engine.py "素材/*.mp4" --crop 420,0,1500,1080 --width 720 -o 输出
+"""
+
+import argparse
+import glob
+import json
+import math
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+
+import auto_crop
+from crop_track import CropTrack
+from encoder_profiles import PROFILES, EncoderSettings, auto_tune
+from export_metrics import ExportMetrics, JsonLinesSink, summary_bottleneck
+from frame_store import DEFAULT_STORE_DIR, FrameStore, StoredCapture
+from lazy_modules import LazyModule, ffmpeg_binary
+from output_cache import (
+    DEFAULT_CACHE_DIR,
+    OutputCache,
+    detach_output,
+    job_key,
+    job_outputs,
+)
+
+cv2 = LazyModule("cv2")
+
+# 各封装格式可直接复制（不重新编码）的音频编码
+COPYABLE_AUDIO_CODECS = {
+    ".mp4": {"aac", "mp3", "alac", "ac3", "eac3", "opus", "flac"},
+    ".m4v": {"aac", "mp3", "alac", "ac3", "eac3"},
+    ".mov": {"aac", "mp3", "alac", "ac3", "eac3", "pcm_s16le", "pcm_s24le"},
+    ".mkv": {"aac", "mp3", "alac", "ac3", "eac3", "opus", "flac", "vorbis"},
+    ".avi": {"mp3", "ac3", "pcm_s16le"},
+}
+
+
+def probe_audio_codec(path):
+    """读取源文件第一条音轨的编码名，无音轨时返回 None"""
+    result = subprocess.run(
+        [ffmpeg_binary(), "-hide_banner", "-i", path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    info = result.stderr.decode("utf-8", "replace")
+    match = re.search(r"Stream #\d+:\d+.*?: Audio: (\w+)", info)
+    return match.group(1) if match else None
+
+
+def choose_audio_codec(source_path, output_path, audio_mode="auto", trimmed=False):
+    """决定音频是直接复制还是重新编码为 AAC
+
+    audio_mode 为 "copy" 时强制复制，为 "aac" 时强制重新编码，
+    "auto" 时仅在源音频编码与输出封装兼容时复制。复制只能在包边界起止，
+    所以 "auto" 模式下从中间开始截取（trimmed）时改为重新编码以做到采样级对齐。
+    返回 None 表示源文件没有音轨。
+    """
+    codec = probe_audio_codec(source_path)
+    if codec is None:
+        return None
+    if audio_mode == "copy":
+        return "copy"
+    if audio_mode == "aac" or trimmed:
+        return "aac"
+    ext = os.path.splitext(output_path)[1].lower()
+    if codec in COPYABLE_AUDIO_CODECS.get(ext, ()):
+        return "copy"
+    return "aac"
+
+
+def audio_mux_args(
+    audio_source, output_path, audio_mode="auto", start_time=0.0, duration=None
+):
+    """生成把源文件音轨作为第二个输入封装进输出的 ffmpeg 参数，无音轨时为空
+
+    start_time/duration（秒）指定截取的音频范围，与视频的入点出点一致。
+    """
+    audio_codec = choose_audio_codec(
+        audio_source, output_path, audio_mode, trimmed=start_time > 0
+    )
+    if not audio_codec:
+        return []
+    args = []
+    if start_time > 0:
+        args += ["-ss", f"{start_time:.6f}"]
+    if duration is not None:
+        args += ["-t", f"{duration:.6f}"]
+    # 取源文件第一条音轨，兼容时按包复制，-shortest 在包边界截断
+    return args + [
+        "-i",
+        audio_source,
+        "-map",
+        "0:v:0",
+        "-map",
+        "1:a:0",
+        "-c:a",
+        audio_codec,
+        "-shortest",
+    ]
+
+
+class FFmpegPipeWriter:
+    """把 BGR 帧通过管道直接送入 ffmpeg 编码，并在同一进程内封装源音频"""
+
+    def __init__(
+        self,
+        output_path,
+        size,
+        fps,
+        audio_source=None,
+        codec="libx264",
+        audio_mode="auto",
+        threads=4,
+        audio_start=0.0,
+        audio_duration=None,
+        encoder=None,
+    ):
+        self.output_path = output_path
+        width, height = size
+        cmd = [
+            ffmpeg_binary(),
+            "-y",
+            "-loglevel",
+            "error",
+            # 视频输入：原始 BGR 帧，省去颜色空间转换
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "bgr24",
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            f"{fps:.6f}",
+            "-i",
+            "-",
+        ]
+        if audio_source:
+            cmd += audio_mux_args(
+                audio_source, output_path, audio_mode, audio_start, audio_duration
+            )
+        cmd += [
+            "-c:v",
+            codec,
+            # yuv420p 要求宽高为偶数，奇数时裁掉最后一行/列而不是补黑边
+            "-vf",
+            "crop=trunc(iw/2)*2:trunc(ih/2)*2",
+            "-pix_fmt",
+            "yuv420p",
+            "-threads",
+            str(threads),
+        ]
+        if encoder is not None:
+            cmd += encoder.ffmpeg_args()
+        cmd += [
+            "-movflags",
+            "+faststart",  # 优化网络播放
+            output_path,
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frame):
+        """写入一帧"""
+        try:
+            # 连续内存直接交给管道，不再额外复制一份字节串
+            data = frame.data if frame.flags.c_contiguous else frame.tobytes()
+            self.proc.stdin.write(data)
+        except BrokenPipeError:
+            raise RuntimeError(f"编码器异常退出: {self._read_error()}")
+
+    def close(self):
+        """结束输入并等待编码完成"""
+        self.proc.stdin.close()
+        error = self._read_error()
+        if self.proc.wait() != 0:
+            raise RuntimeError(f"编码失败: {error}")
+
+    def kill(self):
+        """异常时终止编码进程"""
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+    def _read_error(self):
+        return self.proc.stderr.read().decode("utf-8", "replace").strip()
+
+
+def compute_target_size(crop_coords, width=0, height=0, square=False):
+    """根据裁切区域和用户输入的宽高计算输出尺寸
+
+    width/height 为 0 表示未填写；返回 None 表示保持裁切尺寸输出。
+    """
+    # 正方形模式特殊处理
+    if square:
+        valid_sizes = [s for s in [width, height] if s > 0]
+        if not valid_sizes:
+            return None
+        size = min(valid_sizes) if len(valid_sizes) > 1 else valid_sizes[0]
+        return (size, size)
+
+    # 自动比例计算
+    if not crop_coords:
+        return (width or None, height or None)
+
+    orig_width = crop_coords[2] - crop_coords[0]
+    orig_height = crop_coords[3] - crop_coords[1]
+
+    # 计算缺失的尺寸
+    if width <= 0 and height <= 0:
+        return None
+    if width <= 0:
+        width = int(height * orig_width / orig_height)
+    if height <= 0:
+        height = int(width * orig_height / orig_width)
+
+    return (max(1, width), max(1, height))
+
+
+def default_output_path(input_path, output_dir, tag=None):
+    """输出文件命名规则：输出目录/cropped_原文件名，多路输出时加上标签"""
+    prefix = f"cropped_{tag}_" if tag else "cropped_"
+    return os.path.join(output_dir, prefix + os.path.basename(input_path))
+
+
+# 可续传导出中每个分段（检查点）的目标时长（秒）
+CHECKPOINT_SECONDS = 60
+# 分段进程每编码该数量的帧向主进程汇报一次进度
+SEGMENT_PROGRESS_FRAMES = 30
+JOURNAL_NAME = "journal.json"
+
+
+class CropJob:
+    """一次裁切导出任务的全部参数"""
+
+    def __init__(
+        self,
+        input_path,
+        output_path,
+        crop_coords,
+        target_size=None,
+        audio_mode="auto",
+        threads=4,
+        workers=None,
+        max_buffer_mb=256,
+        segments=1,
+        start_time=0.0,
+        end_time=None,
+        extra_outputs=None,
+        engine="opencv",
+        resumable=False,
+        crop_track=None,
+        encoder=None,
+        frame_store=None,
+    ):
+        self.input_path = input_path
+        self.output_path = output_path
+        # 动态裁切时 crop_coords 为第一个关键帧的裁切框，决定默认输出尺寸
+        self.crop_track = crop_track
+        if crop_track is not None:
+            crop_coords = crop_track.first_crop
+        self.crop_coords = tuple(int(v) for v in crop_coords)
+        self.target_size = tuple(target_size) if target_size else None
+        self.audio_mode = audio_mode
+        self.threads = threads
+        # 裁切/缩放线程数，None 表示按 CPU 核数自动选择
+        self.workers = workers
+        # 流水线中缓存帧占用内存的上限
+        self.max_buffer_mb = max_buffer_mb
+        # 大于 1 时按关键帧切分为多段并行编码
+        self.segments = segments
+        # 入点/出点（秒），end_time 为 None 表示到文件末尾
+        self.start_time = max(0.0, float(start_time or 0.0))
+        self.end_time = float(end_time) if end_time is not None else None
+        # 同一次解码中额外生成的输出（OutputSpec 列表）
+        self.extra_outputs = list(extra_outputs or [])
+        # "opencv"：BGR 帧在本进程裁切缩放；"ffmpeg"：在解码器的 YUV 帧上原生处理
+        self.engine = engine
+        # 按约 CHECKPOINT_SECONDS 切分并记录日志，中断后重新导出时跳过已完成的分段
+        self.resumable = resumable
+        # libx264 的 preset/crf（EncoderSettings），默认使用编码器默认值
+        self.encoder = encoder or EncoderSettings()
+        # 解码帧存储（FrameStore），设置后首次导出完整解码一次，之后从内存映射读帧
+        self.frame_store = frame_store
+
+    def to_spec(self):
+        """可写入 JSON 的描述，与 from_spec 对应，用于把任务交给其他进程或机器"""
+        return {
+            "input_path": self.input_path,
+            "output_path": self.output_path,
+            "crop_coords": list(self.crop_coords),
+            "target_size": list(self.target_size) if self.target_size else None,
+            "audio_mode": self.audio_mode,
+            "threads": self.threads,
+            "workers": self.workers,
+            "max_buffer_mb": self.max_buffer_mb,
+            "segments": self.segments,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "extra_outputs": [
+                [
+                    list(spec.crop_coords),
+                    list(spec.target_size) if spec.target_size else None,
+                    spec.output_path,
+                ]
+                for spec in self.extra_outputs
+            ],
+            "engine": self.engine,
+            "resumable": self.resumable,
+            "crop_track": self.crop_track.to_spec() if self.crop_track else None,
+            "encoder": self.encoder.to_spec(),
+            "frame_store": (
+                [self.frame_store.root, self.frame_store.max_bytes]
+                if self.frame_store
+                else None
+            ),
+        }
+
+    @classmethod
+    def from_spec(cls, spec):
+        spec = dict(spec)
+        track = spec.pop("crop_track", None)
+        encoder = spec.pop("encoder", None)
+        extra = spec.pop("extra_outputs", [])
+        store = spec.pop("frame_store", None)
+        return cls(
+            **spec,
+            extra_outputs=[OutputSpec(*item) for item in extra],
+            crop_track=CropTrack.from_spec(track) if track else None,
+            encoder=EncoderSettings(**encoder) if encoder else None,
+            frame_store=FrameStore(*store) if store else None,
+        )
+
+
+def parse_time(text):
+    """解析 "90"、"1:30"、"01:02:03.5" 形式的时间，返回秒数；空串返回 None"""
+    text = str(text).strip()
+    if not text:
+        return None
+    seconds = 0.0
+    for part in text.split(":"):
+        seconds = seconds * 60 + float(part)
+    if seconds < 0:
+        raise ValueError(f"时间不能为负数: {text}")
+    return seconds
+
+
+class ExportCancelled(Exception):
+    """导出被用户取消"""
+
+
+_END = object()
+
+
+def run_frame_pipeline(
+    read_frame,
+    transform,
+    write_frame,
+    workers=None,
+    max_pending=8,
+    on_frame=None,
+    metrics=None,
+):
+    """解码 → 裁切/缩放 → 编码 三级流水线
+
+    read_frame() 在解码线程中调用，返回 None 表示结束；transform(frame)
+    在线程池中并行执行；write_frame(result) 在调用线程中按原始帧顺序执行。
+    解码线程与编码端之间的有界队列最多容纳 max_pending 帧，队列满时解码
+    线程阻塞，从而限制内存占用。metrics 用于记录队列深度。返回写入的帧数。
+    """
+    workers = workers or min(4, os.cpu_count() or 1)
+    pending = queue.Queue(maxsize=max(1, max_pending))
+    stop = threading.Event()
+    errors = []
+
+    def put(item):
+        # 编码端出错退出后不再阻塞在满队列上
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+
+        def decode():
+            try:
+                while not stop.is_set():
+                    frame = read_frame()
+                    if frame is None:
+                        break
+                    if not put(pool.submit(transform, frame)):
+                        break
+            except Exception as e:
+                errors.append(e)
+            finally:
+                put(_END)
+
+        decoder = threading.Thread(target=decode, name="decoder", daemon=True)
+        decoder.start()
+        frame_count = 0
+        try:
+            while True:
+                if metrics:
+                    metrics.gauge("queue_depth", pending.qsize())
+                item = pending.get()
+                if item is _END:
+                    break
+                # 按提交顺序取结果，保证输出帧序不变
+                write_frame(item.result())
+                frame_count += 1
+                if on_frame:
+                    on_frame(frame_count)
+        finally:
+            stop.set()
+            decoder.join()
+
+    if errors:
+        raise errors[0]
+    return frame_count
+
+
+def pending_frames_for_budget(max_buffer_mb, src_size, dst_size):
+    """根据内存上限计算流水线中允许同时存在的帧数"""
+    frame_bytes = src_size[0] * src_size[1] * 3 + dst_size[0] * dst_size[1] * 3
+    return max(2, int(max_buffer_mb * 1024 * 1024 // frame_bytes))
+
+
+def open_stored_capture(job, metrics, cancel_event=None):
+    """从解码帧存储读取输入（缺失时先完整解码），超出存储上限时返回 None"""
+    try:
+        with metrics.stage("store"):
+            stored = job.frame_store.load(job.input_path, cancel_event)
+    except InterruptedError:
+        raise ExportCancelled("导出已取消")
+    except ValueError as e:
+        metrics.emit("frame_store_skipped", reason=str(e))
+        return None
+    return stored.capture()
+
+
+def open_source(job, metrics=None, cancel_event=None):
+    """打开输入视频，返回 (cap, 视频信息, 限制在画面内的裁切区域)
+
+    任务设置了帧存储时 cap 为读取内存映射帧的 StoredCapture；原生 YUV 引擎
+    由 ffmpeg 直接读取源文件，不使用帧存储。
+    """
+    metrics = metrics or ExportMetrics()
+    cap = None
+    if job.frame_store is not None and job.engine != "ffmpeg":
+        cap = open_stored_capture(job, metrics, cancel_event)
+    with metrics.stage("open"):
+        if cap is None:
+            cap = cv2.VideoCapture(job.input_path)
+        if not cap.isOpened():
+            raise RuntimeError(f"无法打开视频文件: {job.input_path}")
+
+        info = {
+            "fps": cap.get(cv2.CAP_PROP_FPS),
+            "frames": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        }
+
+    try:
+        crop = clamp_crop(job.crop_coords, info)
+    except ValueError:
+        cap.release()
+        raise
+    return cap, info, crop
+
+
+def clamp_crop(crop_coords, info):
+    """把裁切区域限制在画面内，区域为空时抛出 ValueError"""
+    x1, y1, x2, y2 = crop_coords
+    x1, x2 = max(0, x1), min(info["width"], x2)
+    y1, y2 = max(0, y1), min(info["height"], y2)
+    if x2 <= x1 or y2 <= y1:
+        raise ValueError(f"裁切区域无效: {crop_coords}")
+    return (x1, y1, x2, y2)
+
+
+def frame_range(job, info):
+    """把任务的入点/出点换算为 (起始帧, 帧数)，帧数为 None 表示读到文件末尾"""
+    fps = info["fps"]
+    start_frame = int(round(job.start_time * fps))
+    if job.end_time is None:
+        return start_frame, None
+    end_frame = int(round(job.end_time * fps))
+    if end_frame <= start_frame:
+        raise ValueError(f"出点必须晚于入点: {job.start_time} - {job.end_time}")
+    return start_frame, end_frame - start_frame
+
+
+def output_size(job, crop):
+    """任务的输出尺寸：指定了目标尺寸则缩放，否则保持裁切尺寸"""
+    x1, y1, x2, y2 = crop
+    return job.target_size if job.target_size else (x2 - x1, y2 - y1)
+
+
+def encode_frames(
+    job,
+    cap,
+    info,
+    crop,
+    out,
+    max_frames=None,
+    workers=None,
+    on_frame=None,
+    cancel_event=None,
+    metrics=None,
+    first_frame=0,
+):
+    """从 cap 当前位置（第 first_frame 帧）读帧，裁切缩放后写入 out
+
+    最多 max_frames 帧，返回帧数。cancel_event 被置位后在读取下一帧前抛出
+    ExportCancelled。解码、裁切、缩放、编码各阶段耗时记入 metrics。
+    """
+    if job.crop_track is not None:
+        return encode_tracked_frames(
+            job,
+            cap,
+            info,
+            crop,
+            out,
+            max_frames,
+            workers,
+            on_frame,
+            cancel_event,
+            metrics,
+            first_frame,
+        )
+    metrics = metrics or ExportMetrics()
+    x1, y1, x2, y2 = crop
+    target_size = job.target_size
+    width, height = output_size(job, crop)
+    workers = workers or job.workers or min(4, os.cpu_count() or 1)
+    max_pending = pending_frames_for_budget(
+        job.max_buffer_mb, (info["width"], info["height"]), (width, height)
+    )
+    read_count = 0
+
+    def read_frame():
+        nonlocal read_count
+        if cancel_event is not None and cancel_event.is_set():
+            raise ExportCancelled("导出已取消")
+        if max_frames is not None and read_count >= max_frames:
+            return None
+        with metrics.stage("decode"):
+            ret, frame = cap.read()
+        if not ret:
+            return None
+        read_count += 1
+        return frame
+
+    def transform(frame):
+        # 执行裁切和缩放
+        cropped = frame[y1:y2, x1:x2]
+        if target_size:
+            with metrics.stage("resize"):
+                return cv2.resize(cropped, target_size)
+        if cropped.flags.c_contiguous:
+            # 裁切区域占满整行时本身就是连续内存，直接写出
+            return cropped
+        # 在工作线程中复制为连续内存，写入端不必再逐帧 tobytes
+        with metrics.stage("crop"):
+            return cropped.copy()
+
+    def write_frame(image):
+        with metrics.stage("encode"):
+            out.write(image)
+
+    return run_frame_pipeline(
+        read_frame,
+        transform,
+        write_frame,
+        workers=workers or job.workers,
+        max_pending=max_pending,
+        on_frame=on_frame,
+        metrics=metrics,
+    )
+
+
+def encode_tracked_frames(
+    job,
+    cap,
+    info,
+    crop,
+    out,
+    max_frames=None,
+    workers=None,
+    on_frame=None,
+    cancel_event=None,
+    metrics=None,
+    first_frame=0,
+):
+    """动态裁切版的 encode_frames：逐帧查预计算的裁切框表，缩放到固定输出尺寸"""
+    metrics = metrics or ExportMetrics()
+    width, height = output_size(job, crop)
+    frame_size = (info["width"], info["height"])
+    # 读到文件末尾时容器帧数未必准确，超出表长的帧沿用最后一行
+    table_frames = max_frames or max(1, info["frames"] - first_frame)
+    with metrics.stage("open"):
+        table = job.crop_track.table(frame_size, first_frame, table_frames)
+    last_row = len(table) - 1
+    workers = workers or job.workers or min(4, os.cpu_count() or 1)
+    max_pending = pending_frames_for_budget(
+        job.max_buffer_mb, frame_size, (width, height)
+    )
+    read_count = 0
+
+    def read_frame():
+        nonlocal read_count
+        if cancel_event is not None and cancel_event.is_set():
+            raise ExportCancelled("导出已取消")
+        if max_frames is not None and read_count >= max_frames:
+            return None
+        with metrics.stage("decode"):
+            ret, frame = cap.read()
+        if not ret:
+            return None
+        read_count += 1
+        return read_count - 1, frame
+
+    def transform(item):
+        index, frame = item
+        x, y, w, h = table[min(index, last_row)]
+        cropped = frame[y : y + h, x : x + w]
+        if w == width and h == height:
+            with metrics.stage("crop"):
+                return cropped.copy()
+        with metrics.stage("resize"):
+            return cv2.resize(cropped, (width, height))
+
+    def write_frame(image):
+        with metrics.stage("encode"):
+            out.write(image)
+
+    return run_frame_pipeline(
+        read_frame,
+        transform,
+        write_frame,
+        workers=workers,
+        max_pending=max_pending,
+        on_frame=on_frame,
+        metrics=metrics,
+    )
+
+
+def job_stats(job, frame_count, start_time, encoded_frames=None):
+    """汇总一次导出的帧数、耗时、速度和输出大小
+
+    encoded_frames 为本次实际编码的帧数（续传时不含复用的分段），速度按它计算。
+    """
+    wall_time = time.perf_counter() - start_time
+    if encoded_frames is None:
+        encoded_frames = frame_count
+    return {
+        "input": job.input_path,
+        "output": job.output_path,
+        "frames": frame_count,
+        "wall_time": wall_time,
+        "fps": encoded_frames / wall_time if wall_time > 0 else 0.0,
+        "output_bytes": os.path.getsize(job.output_path),
+    }
+
+
+def remove_partial_output(path):
+    """删除未完成的输出文件"""
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def export_video(job, progress=None, cancel_event=None, metrics=None, cache=None):
+    """裁切、缩放、编码与音频封装一次完成
+
+    progress(frame_count, total_frames) 在每帧写入后调用（在调用线程中）。
+    cancel_event 为 threading.Event 等带 is_set() 的对象，置位后尽快停止
+    解码和编码、删除未完成的输出并抛出 ExportCancelled。
+    metrics 为 ExportMetrics，记录各阶段耗时并发出结构化事件。
+    cache 为 OutputCache 时，相同输入和参数的任务直接复用缓存的输出。
+    返回包含帧数、耗时、速度、输出大小和指标摘要（"metrics"）的统计字典，
+    命中缓存时 "cached" 为 True。
+    """
+    metrics = metrics or ExportMetrics(job_id=job.output_path)
+    metrics.emit("job_start", input=job.input_path, engine=job.engine)
+
+    def on_progress(frame_count, total_frames):
+        metrics.progress(frame_count, total_frames)
+        if progress:
+            progress(frame_count, total_frames)
+
+    try:
+        if cache is None:
+            stats = dispatch_export(job, on_progress, cancel_event, metrics)
+        else:
+            stats = export_video_cached(job, cache, on_progress, cancel_event, metrics)
+    except ExportCancelled:
+        metrics.emit("job_cancelled", summary=metrics.summary())
+        raise
+    except Exception as e:
+        metrics.emit("job_failed", error=str(e), summary=metrics.summary())
+        raise
+    stats["metrics"] = metrics.summary()
+    metrics.emit(
+        "job_end",
+        frames=stats["frames"],
+        fps=round(stats["fps"], 2),
+        output_bytes=stats["output_bytes"],
+        cached=stats.get("cached", False),
+        summary=stats["metrics"],
+    )
+    return stats
+
+
+def dispatch_export(job, progress, cancel_event, metrics):
+    """按引擎和任务参数选择导出方式并执行"""
+    if job.engine == "ffmpeg":
+        export = export_video_native
+    elif job.extra_outputs:
+        export = export_variants
+    elif job.segments > 1 or job.resumable:
+        export = export_video_segmented
+    else:
+        export = export_video_single
+    # 上次命中缓存时输出是缓存条目的硬链接，先断开再覆盖写入
+    for path in job_outputs(job):
+        detach_output(path)
+    stats = export(job, progress, cancel_event, metrics)
+    metrics.count("frames_written", stats["frames"])
+    return stats
+
+
+def export_video_cached(job, cache, progress, cancel_event, metrics):
+    """先查缓存，未命中时导出并存入缓存
+
+    同一个键同时只允许一个进程导出，其他进程等待它完成后直接命中。
+    """
+    start_time = time.perf_counter()
+    outputs = job_outputs(job)
+    with metrics.stage("cache"):
+        key = job_key(job)
+        cached = cache.fetch(key, outputs)
+        lock = cache.lock(key)
+        while cached is None and not lock.try_acquire():
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExportCancelled("导出已取消")
+            time.sleep(0.5)
+            cached = cache.fetch(key, outputs)
+        if cached is None and lock.held:
+            # 等锁期间其他进程可能已经完成同一任务
+            cached = cache.fetch(key, outputs)
+
+    if cached is not None:
+        lock.release()
+        metrics.count("cache_hits")
+        if progress:
+            progress(cached["frames"], cached["frames"])
+        stats = job_stats(job, cached["frames"], start_time)
+        if job.extra_outputs:
+            stats["outputs"] = outputs
+            stats["output_bytes"] = sum(os.path.getsize(p) for p in outputs)
+        stats["cached"] = True
+        return stats
+
+    try:
+        metrics.count("cache_misses")
+        stats = dispatch_export(job, progress, cancel_event, metrics)
+        try:
+            with metrics.stage("cache"):
+                cache.store(key, outputs, {"frames": stats["frames"]})
+        except OSError as e:
+            # 缓存写入失败（磁盘满等）不影响本次导出结果
+            metrics.emit("cache_error", error=str(e))
+    finally:
+        lock.release()
+    return stats
+
+
+def export_video_single(job, progress=None, cancel_event=None, metrics=None):
+    """单路输出的流水线导出"""
+    metrics = metrics or ExportMetrics()
+    start_time = time.perf_counter()
+    cap, info, crop = open_source(job, metrics, cancel_event)
+    try:
+        start_frame, max_frames = frame_range(job, info)
+    except ValueError:
+        cap.release()
+        raise
+    fps = info["fps"]
+    total_frames = max_frames or max(0, info["frames"] - start_frame)
+    # 启动编码器前需要探测源音轨
+    with metrics.stage("audio_probe"):
+        out = FFmpegPipeWriter(
+            job.output_path,
+            output_size(job, crop),
+            fps,
+            audio_source=job.input_path,
+            audio_mode=job.audio_mode,
+            threads=job.threads,
+            encoder=job.encoder,
+            audio_start=start_frame / fps,
+            audio_duration=max_frames / fps if max_frames else None,
+        )
+
+    def on_frame(frame_count):
+        if progress:
+            progress(frame_count, total_frames)
+
+    try:
+        # 定位入点：OpenCV 先跳到之前最近的关键帧，再解码到目标帧
+        if start_frame > 0:
+            with metrics.stage("decode"):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_count = encode_frames(
+            job,
+            cap,
+            info,
+            crop,
+            out,
+            max_frames=max_frames,
+            on_frame=on_frame,
+            cancel_event=cancel_event,
+            metrics=metrics,
+            first_frame=start_frame,
+        )
+        # 容器帧数只是估计，解码结束后按实际帧数报告完成，之后只剩封装
+        if progress and frame_count != total_frames:
+            progress(frame_count, frame_count)
+        # 编码器清空缓冲并写入音频、索引
+        with metrics.stage("finalize"):
+            out.close()
+    except ExportCancelled:
+        out.kill()
+        remove_partial_output(job.output_path)
+        raise
+    except Exception as e:
+        out.kill()
+        remove_partial_output(job.output_path)
+        raise RuntimeError(f"视频处理失败: {str(e)}")
+    finally:
+        cap.release()
+
+    if frame_count < total_frames:
+        # 容器记录的帧数与实际可解码帧数不一致（损坏或截断的源文件）
+        metrics.count("frames_missing", total_frames - frame_count)
+    return job_stats(job, frame_count, start_time)
+
+
+def probe_keyframes(path):
+    """返回视频流全部关键帧的时间戳（秒），只解码关键帧"""
+    result = subprocess.run(
+        [
+            ffmpeg_binary(),
+            "-hide_banner",
+            "-skip_frame",
+            "nokey",
+            "-i",
+            path,
+            "-map",
+            "0:v:0",
+            "-vf",
+            "showinfo",
+            "-f",
+            "null",
+            "-",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    info = result.stderr.decode("utf-8", "replace")
+    return [float(t) for t in re.findall(r"pts_time:\s*(-?[\d.]+)", info)]
+
+
+def plan_segments(keyframe_frames, start_frame, end_frame, count, to_eof=False):
+    """在关键帧处把 [start_frame, end_frame) 切成约 count 段，返回 [(起始帧, 帧数)]
+
+    to_eof 为 True 时最后一段帧数为 None，表示一直读到文件末尾
+    （容器记录的总帧数未必准确）。
+    """
+    points = sorted(set(f for f in keyframe_frames if start_frame < f < end_frame))
+    bounds = [start_frame]
+    for i in range(1, count):
+        ideal = start_frame + (end_frame - start_frame) * i / count
+        candidates = [p for p in points if p > bounds[-1]]
+        if not candidates:
+            break
+        bounds.append(min(candidates, key=lambda p: abs(p - ideal)))
+    segments = [(start, end - start) for start, end in zip(bounds, bounds[1:])]
+    segments.append((bounds[-1], None if to_eof else end_frame - bounds[-1]))
+    return segments
+
+
+def export_segment(
+    job, start_frame, max_frames, segment_path, cancel_event=None, frame_counts=None
+):
+    """在独立进程中导出一个分段（仅视频），返回 (写入的帧数, 指标摘要)
+
+    先写入临时文件，编码完整结束后才改名为 segment_path，
+    因此 segment_path 存在即表示该分段完整可用。frame_counts 为跨进程共享的
+    字典，编码期间定期写入 {segment_path: 已写入帧数}。
+    """
+    metrics = ExportMetrics()
+
+    def on_frame(frame_count):
+        if frame_counts is not None and frame_count % SEGMENT_PROGRESS_FRAMES == 0:
+            frame_counts[segment_path] = frame_count
+
+    cap, info, crop = open_source(job, metrics, cancel_event)
+    part_path = segment_path + ".part.mp4"
+    out = FFmpegPipeWriter(
+        part_path,
+        output_size(job, crop),
+        info["fps"],
+        threads=job.threads,
+        encoder=job.encoder,
+    )
+    try:
+        with metrics.stage("decode"):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_count = encode_frames(
+            job,
+            cap,
+            info,
+            crop,
+            out,
+            max_frames=max_frames,
+            workers=1,
+            on_frame=on_frame,
+            cancel_event=cancel_event,
+            metrics=metrics,
+            first_frame=start_frame,
+        )
+        with metrics.stage("finalize"):
+            out.close()
+        os.replace(part_path, segment_path)
+    except Exception:
+        out.kill()
+        remove_partial_output(part_path)
+        raise
+    finally:
+        cap.release()
+    return frame_count, metrics.summary()
+
+
+def concat_segments(
+    segment_paths,
+    audio_source,
+    output_path,
+    audio_mode="auto",
+    audio_start=0.0,
+    audio_duration=None,
+):
+    """不重新编码地拼接视频分段，并一次性封装整段源音频"""
+    list_path = os.path.join(os.path.dirname(segment_paths[0]), "segments.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            # concat 按列表文件所在目录解析相对路径，统一写绝对路径
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [
+        ffmpeg_binary(),
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        list_path,
+    ]
+    cmd += audio_mux_args(
+        audio_source, output_path, audio_mode, audio_start, audio_duration
+    )
+    cmd += ["-c:v", "copy", "-movflags", "+faststart", output_path]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        error = result.stderr.decode("utf-8", "replace").strip()
+        raise RuntimeError(f"分段拼接失败: {error}")
+
+
+def resume_dir_for(output_path):
+    """可续传导出的分段与日志目录，放在输出文件旁以便重启后找到"""
+    return os.path.abspath(output_path) + ".parts"
+
+
+def load_journal(work_dir, key):
+    """读取续传日志，键不匹配（输入或参数已变化）或日志损坏时返回 None"""
+    try:
+        with open(os.path.join(work_dir, JOURNAL_NAME), encoding="utf-8") as f:
+            journal = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if journal.get("key") != key:
+        return None
+    return journal
+
+
+def save_journal(work_dir, journal):
+    """先写临时文件再替换，进程在写入中途被杀也不会留下损坏的日志"""
+    path = os.path.join(work_dir, JOURNAL_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(journal, f)
+    os.replace(path + ".tmp", path)
+
+
+def export_video_segmented(job, progress=None, cancel_event=None, metrics=None):
+    """分段并行导出：按关键帧切分，各分段在独立进程中编码后无损拼接
+
+    进度包括各分段进程定期汇报的已编码帧数；取消时通过跨进程事件通知所有分段停止。
+    各分段进程的阶段耗时合并进 metrics。
+
+    job.resumable 时分段写在输出旁的 .parts 目录并记录日志：中断、取消或
+    拼接失败后保留已完成的分段，再次导出同一任务时只补齐缺失的分段，
+    所有分段齐全后才拼接。并行进程数仍由 job.segments 决定。
+    """
+    metrics = metrics or ExportMetrics()
+    start_time = time.perf_counter()
+    cap, info, crop = open_source(job, metrics, cancel_event)
+    cap.release()
+
+    fps = info["fps"]
+    start_frame, max_frames = frame_range(job, info)
+    end_frame = start_frame + max_frames if max_frames else info["frames"]
+    total_frames = end_frame - start_frame
+
+    journal = None
+    if job.resumable:
+        work_dir = resume_dir_for(job.output_path)
+        with metrics.stage("open"):
+            key = job_key(job)
+        journal = load_journal(work_dir, key)
+        if journal is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir, exist_ok=True)
+    else:
+        work_dir = tempfile.mkdtemp(prefix="crop_segments_")
+
+    if journal is None:
+        count = job.segments
+        if job.resumable:
+            count = max(count, math.ceil(total_frames / (CHECKPOINT_SECONDS * fps)))
+        with metrics.stage("open"):
+            keyframes = [round(t * fps) for t in probe_keyframes(job.input_path)]
+        segments = plan_segments(
+            keyframes, start_frame, end_frame, count, to_eof=not max_frames
+        )
+        journal = {"key": key if job.resumable else None, "plan": segments, "done": {}}
+        if job.resumable:
+            save_journal(work_dir, journal)
+    segments = [tuple(segment) for segment in journal["plan"]]
+    segment_paths = [
+        os.path.join(work_dir, f"segment_{i:04d}.mp4") for i in range(len(segments))
+    ]
+    # 日志中记录完成且文件仍在的分段直接复用
+    done = {
+        int(i): frames
+        for i, frames in journal["done"].items()
+        if os.path.exists(segment_paths[int(i)])
+    }
+    todo = [i for i in range(len(segments)) if i not in done]
+    if done:
+        metrics.count("segments_reused", len(done))
+        metrics.emit("job_resumed", segments_done=len(done), segments=len(segments))
+
+    # 分段进程共享的取消标志：外部取消或任一分段失败时通知其余分段尽快停止
+    manager = multiprocessing.Manager()
+    remote_cancel = manager.Event()
+    # 正在编码的分段已写入的帧数
+    segment_progress = manager.dict()
+    try:
+        frame_count = sum(done.values())
+        reported = frame_count
+        if progress and frame_count:
+            progress(frame_count, total_frames)
+        workers = max(1, min(job.segments, len(todo)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = {
+                pool.submit(
+                    export_segment,
+                    job,
+                    *segments[i],
+                    segment_paths[i],
+                    remote_cancel,
+                    segment_progress,
+                ): i
+                for i in todo
+            }
+            try:
+                while pending:
+                    finished, _ = wait(
+                        pending, timeout=0.2, return_when=FIRST_COMPLETED
+                    )
+                    if cancel_event is not None and cancel_event.is_set():
+                        remote_cancel.set()
+                    for future in finished:
+                        index = pending.pop(future)
+                        segment_frames, segment_summary = future.result()
+                        frame_count += segment_frames
+                        metrics.merge(segment_summary)
+                        metrics.emit("segment_done", frames=segment_frames)
+                        if job.resumable:
+                            journal["done"][str(index)] = segment_frames
+                            save_journal(work_dir, journal)
+                    if progress:
+                        counts = segment_progress.copy()
+                        current = frame_count + sum(
+                            counts.get(segment_paths[i], 0) for i in pending.values()
+                        )
+                        if current != reported:
+                            reported = current
+                            progress(current, total_frames)
+            except BaseException:
+                # 不再启动排队的分段，正在编码的分段在下一帧检查到取消后退出，
+                # 进程池退出时只需等待它们收尾而不是编码完整个分段
+                remote_cancel.set()
+                for future in pending:
+                    future.cancel()
+                raise
+        # 容器帧数只是估计，解码结束后按实际帧数报告完成，之后只剩封装
+        if progress and frame_count != total_frames:
+            progress(frame_count, frame_count)
+        # 拼接分段并封装音频
+        with metrics.stage("mux"):
+            concat_segments(
+                segment_paths,
+                job.input_path,
+                job.output_path,
+                job.audio_mode,
+                audio_start=start_frame / fps,
+                audio_duration=max_frames / fps if max_frames else None,
+            )
+    except ExportCancelled:
+        remove_partial_output(job.output_path)
+        if not job.resumable:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        remove_partial_output(job.output_path)
+        if not job.resumable:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        raise RuntimeError(f"视频处理失败: {str(e)}")
+    finally:
+        manager.shutdown()
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return job_stats(
+        job, frame_count, start_time, encoded_frames=frame_count - sum(done.values())
+    )
+
+
+class OutputSpec:
+    """多路输出中的一路：裁切区域、输出尺寸和输出路径"""
+
+    def __init__(self, crop_coords, target_size, output_path):
+        self.crop_coords = tuple(int(v) for v in crop_coords)
+        self.target_size = tuple(target_size) if target_size else None
+        self.output_path = output_path
+
+
+def plan_variant_resizes(crops, sizes):
+    """为每一路输出选择缩放来源，实现嵌套尺寸的共享缩放
+
+    crops/sizes 为各路输出（已限制在画面内）的裁切区域和输出尺寸。返回
+    [(输出序号, 来源序号或 None)]，按执行顺序排列：同一裁切区域内先做大尺寸，
+    较小尺寸从不小于它的最小已有结果继续缩小，来源为 None 表示直接从裁切图缩放。
+    """
+    order = sorted(
+        range(len(crops)), key=lambda i: (crops[i], -sizes[i][0] * sizes[i][1])
+    )
+    plan = []
+    done = []
+    for i in order:
+        w, h = sizes[i]
+        sources = [
+            j
+            for j in done
+            if crops[j] == crops[i] and sizes[j][0] >= w and sizes[j][1] >= h
+        ]
+        source = min(sources, key=lambda j: sizes[j][0] * sizes[j][1], default=None)
+        plan.append((i, source))
+        done.append(i)
+    return plan
+
+
+def export_variants(job, progress=None, cancel_event=None, metrics=None):
+    """一次解码、多路输出：每帧分发给多个编码器
+
+    输出包括任务本身的裁切/尺寸/路径以及 job.extra_outputs 中的各路。
+    """
+    if job.segments > 1 or job.resumable:
+        raise ValueError("分段导出暂不支持多路输出")
+    if job.crop_track is not None:
+        raise ValueError("动态裁切暂不支持多路输出")
+
+    metrics = metrics or ExportMetrics()
+    start_time = time.perf_counter()
+    cap, info, _ = open_source(job, metrics, cancel_event)
+    specs = [OutputSpec(job.crop_coords, job.target_size, job.output_path)]
+    specs += job.extra_outputs
+    try:
+        crops = [clamp_crop(spec.crop_coords, info) for spec in specs]
+        start_frame, max_frames = frame_range(job, info)
+    except ValueError:
+        cap.release()
+        raise
+    sizes = [
+        spec.target_size or (x2 - x1, y2 - y1)
+        for spec, (x1, y1, x2, y2) in zip(specs, crops)
+    ]
+    plan = plan_variant_resizes(crops, sizes)
+
+    fps = info["fps"]
+    total_frames = max_frames or max(0, info["frames"] - start_frame)
+    outs = []
+    try:
+        for spec, size in zip(specs, sizes):
+            with metrics.stage("audio_probe"):
+                out = FFmpegPipeWriter(
+                    spec.output_path,
+                    size,
+                    fps,
+                    audio_source=job.input_path,
+                    audio_mode=job.audio_mode,
+                    threads=job.threads,
+                    encoder=job.encoder,
+                    audio_start=start_frame / fps,
+                    audio_duration=max_frames / fps if max_frames else None,
+                )
+            outs.append(out)
+    except Exception:
+        for out in outs:
+            out.kill()
+        cap.release()
+        raise
+
+    read_count = 0
+
+    def read_frame():
+        nonlocal read_count
+        if cancel_event is not None and cancel_event.is_set():
+            raise ExportCancelled("导出已取消")
+        if max_frames is not None and read_count >= max_frames:
+            return None
+        with metrics.stage("decode"):
+            ret, frame = cap.read()
+        if not ret:
+            return None
+        read_count += 1
+        return frame
+
+    def transform(frame):
+        results = [None] * len(specs)
+        for i, source in plan:
+            x1, y1, x2, y2 = crops[i]
+            image = frame[y1:y2, x1:x2] if source is None else results[source]
+            if image.shape[1] != sizes[i][0] or image.shape[0] != sizes[i][1]:
+                with metrics.stage("resize"):
+                    image = cv2.resize(image, sizes[i])
+            results[i] = image
+        return results
+
+    def write_frame(results):
+        with metrics.stage("encode"):
+            for out, image in zip(outs, results):
+                out.write(image)
+
+    def on_frame(frame_count):
+        if progress:
+            progress(frame_count, total_frames)
+
+    src_size = (info["width"], info["height"])
+    max_pending = pending_frames_for_budget(
+        job.max_buffer_mb, src_size, (sum(w * h for w, h in sizes), 1)
+    )
+    try:
+        if start_frame > 0:
+            with metrics.stage("decode"):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_count = run_frame_pipeline(
+            read_frame,
+            transform,
+            write_frame,
+            workers=job.workers,
+            max_pending=max_pending,
+            on_frame=on_frame,
+            metrics=metrics,
+        )
+        # 容器帧数只是估计，解码结束后按实际帧数报告完成，之后只剩封装
+        if progress and frame_count != total_frames:
+            progress(frame_count, frame_count)
+        with metrics.stage("finalize"):
+            for out in outs:
+                out.close()
+    except Exception as e:
+        for out, spec in zip(outs, specs):
+            out.kill()
+            remove_partial_output(spec.output_path)
+        if isinstance(e, ExportCancelled):
+            raise
+        raise RuntimeError(f"视频处理失败: {str(e)}")
+    finally:
+        cap.release()
+
+    if frame_count < total_frames:
+        metrics.count("frames_missing", total_frames - frame_count)
+    stats = job_stats(job, frame_count, start_time)
+    stats["outputs"] = [spec.output_path for spec in specs]
+    stats["output_bytes"] = sum(os.path.getsize(p) for p in stats["outputs"])
+    return stats
+
+
+def probe_pixel_format(path):
+    """读取源文件视频流的像素格式，如 yuv420p，读取失败返回 None"""
+    result = subprocess.run(
+        [ffmpeg_binary(), "-hide_banner", "-i", path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    info = result.stderr.decode("utf-8", "replace")
+    match = re.search(r"Stream #\d+:\d+.*?: Video: [^,]+, (\w+)", info)
+    return match.group(1) if match else None
+
+
+def chroma_subsampling(pix_fmt):
+    """像素格式的色度抽样步长 (水平, 垂直)"""
+    pix_fmt = pix_fmt or "yuv420p"
+    if "420" in pix_fmt or pix_fmt in ("nv12", "nv21"):
+        return (2, 2)
+    if "422" in pix_fmt:
+        return (2, 1)
+    if "411" in pix_fmt:
+        return (4, 1)
+    return (1, 1)
+
+
+def align_crop_to_chroma(crop, subsampling):
+    """把裁切区域的起点和宽高对齐到色度抽样边界，保证色度平面可以直接裁切"""
+    x1, y1, x2, y2 = crop
+    sx, sy = subsampling
+    x1 -= x1 % sx
+    y1 -= y1 % sy
+    width = (x2 - x1) // sx * sx
+    height = (y2 - y1) // sy * sy
+    return (x1, y1, x1 + width, y1 + height)
+
+
+def native_filter_graph(crops, sizes):
+    """生成 filter_complex：在解码器输出的 YUV 平面上直接裁切和缩放"""
+    count = len(crops)
+    chains = ["[0:v]split=%d%s" % (count, "".join(f"[s{i}]" for i in range(count)))]
+    if count == 1:
+        chains = ["[0:v]null[s0]"]
+    for i, ((x1, y1, x2, y2), (w, h)) in enumerate(zip(crops, sizes)):
+        chain = f"[s{i}]crop={x2 - x1}:{y2 - y1}:{x1}:{y1}"
+        if (w, h) != (x2 - x1, y2 - y1):
+            chain += f",scale={w}:{h}:flags=bilinear"
+        # 非等比缩放后 scale 会改写像素宽高比，统一标记为方形像素，与 OpenCV 引擎一致
+        chains.append(chain + f",setsar=1[v{i}]")
+    return ";".join(chains)
+
+
+def export_video_native(job, progress=None, cancel_event=None, metrics=None):
+    """由 ffmpeg 完成解码、裁切、缩放和编码，帧全程保持解码器的 YUV 格式
+
+    不经过 BGR/RGB 转换。裁切起点和宽高按源像素格式的色度抽样对齐，输出
+    尺寸取偶数以满足 yuv420p。支持多路输出（同一个 ffmpeg 进程内 split）。
+    解码到编码都在同一个 ffmpeg 进程内，只记录总耗时（ffmpeg 阶段）。
+    """
+    if job.segments > 1 or job.resumable:
+        raise ValueError("原生 YUV 引擎暂不支持分段导出")
+    if job.crop_track is not None:
+        raise ValueError("原生 YUV 引擎暂不支持动态裁切")
+
+    metrics = metrics or ExportMetrics()
+    start_time = time.perf_counter()
+    cap, info, _ = open_source(job, metrics)
+    cap.release()
+    specs = [OutputSpec(job.crop_coords, job.target_size, job.output_path)]
+    specs += job.extra_outputs
+    with metrics.stage("open"):
+        subsampling = chroma_subsampling(probe_pixel_format(job.input_path))
+    crops = [
+        align_crop_to_chroma(clamp_crop(spec.crop_coords, info), subsampling)
+        for spec in specs
+    ]
+    sizes = []
+    for spec, (x1, y1, x2, y2) in zip(specs, crops):
+        w, h = spec.target_size or (x2 - x1, y2 - y1)
+        sizes.append((max(2, w - w % 2), max(2, h - h % 2)))
+    start_frame, max_frames = frame_range(job, info)
+    fps = info["fps"]
+    total_frames = max_frames or max(0, info["frames"] - start_frame)
+
+    cmd = [
+        ffmpeg_binary(),
+        "-y",
+        "-loglevel",
+        "error",
+        "-nostats",
+        "-progress",
+        "pipe:1",
+    ]
+    # 输入端 -ss 先跳到之前的关键帧再精确解码到入点
+    if start_frame > 0:
+        cmd += ["-ss", f"{start_frame / fps:.6f}"]
+    if max_frames:
+        cmd += ["-t", f"{max_frames / fps:.6f}"]
+    cmd += ["-i", job.input_path, "-filter_complex", native_filter_graph(crops, sizes)]
+    for i, spec in enumerate(specs):
+        cmd += ["-map", f"[v{i}]"]
+        with metrics.stage("audio_probe"):
+            audio_codec = choose_audio_codec(
+                job.input_path,
+                spec.output_path,
+                job.audio_mode,
+                trimmed=start_frame > 0,
+            )
+        if audio_codec:
+            cmd += ["-map", "0:a:0", "-c:a", audio_codec]
+        cmd += [
+            "-c:v",
+            "libx264",
+            "-pix_fmt",
+            "yuv420p",
+            "-threads",
+            str(job.threads),
+            *job.encoder.ffmpeg_args(),
+            "-movflags",
+            "+faststart",
+            spec.output_path,
+        ]
+
+    ffmpeg_start = time.perf_counter()
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    frame_count = 0
+    try:
+        # -progress 每隔约 0.5 秒输出一组 key=value
+        for line in proc.stdout:
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExportCancelled("导出已取消")
+            key, _, value = line.strip().partition("=")
+            if key == "frame" and value.isdigit():
+                frame_count = int(value)
+                if progress:
+                    progress(frame_count, total_frames)
+        error = proc.stderr.read().strip()
+        if proc.wait() != 0:
+            raise RuntimeError(f"编码失败: {error}")
+        metrics.add_time("ffmpeg", time.perf_counter() - ffmpeg_start, frame_count)
+    except Exception as e:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        for spec in specs:
+            remove_partial_output(spec.output_path)
+        if isinstance(e, ExportCancelled):
+            raise
+        raise RuntimeError(f"视频处理失败: {str(e)}")
+
+    if frame_count < total_frames:
+        metrics.count("frames_missing", total_frames - frame_count)
+    stats = job_stats(job, frame_count, start_time)
+    if job.extra_outputs:
+        stats["outputs"] = [spec.output_path for spec in specs]
+        stats["output_bytes"] = sum(os.path.getsize(p) for p in stats["outputs"])
+    return stats
+
+
+def export_with_sink(job, sink=None, cache=None):
+    """在进程池子进程中导出，指标事件交给 sink（需可 pickle，如 JsonLinesSink）"""
+    metrics = ExportMetrics(job_id=job.output_path, sink=sink)
+    return export_video(job, metrics=metrics, cache=cache)
+
+
+def run_batch(jobs, max_workers=None, metrics_sink=None, cache=None):
+    """在有界进程池中并发执行多个任务，按完成顺序逐个产出 (job, 统计或异常)"""
+    if max_workers is None:
+        threads = max((job.threads for job in jobs), default=1)
+        max_workers = max(1, (os.cpu_count() or 1) // threads)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(export_with_sink, job, metrics_sink, cache): job for job in jobs
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                yield job, future.result()
+            except Exception as e:
+                yield job, e
+
+
+def format_stages(summary):
+    """把指标摘要格式化为一行各阶段耗时，耗时最长的阶段标为瓶颈"""
+    stages = summary["stages"]
+    if not stages:
+        return ""
+    bottleneck = summary_bottleneck(summary)
+    parts = [f"{name} {stage['seconds']:.2f}s" for name, stage in stages.items()]
+    return f"{'  '.join(parts)}  瓶颈: {bottleneck}"
+
+
+def expand_inputs(patterns):
+    """展开通配符（Windows 命令行不会自动展开），保持顺序并去重"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def parse_crop(text):
+    """解析 "x1,y1,x2,y2" 形式的裁切区域"""
+    values = [int(v) for v in text.replace(" ", "").split(",")]
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError("裁切区域格式应为 x1,y1,x2,y2")
+    return tuple(values)
+
+
+def load_crop_spec(path):
+    """读取裁切配置文件
+
+    JSON 格式，例如 {"crop": [420, 0, 1500, 1080], "mode": "square", "width": 720}，
+    crop 为 "auto" 时对每个输入自动检测裁切区域。可选的 "track" 描述动态裁切：
+    {"easing": "ease", "keyframes": [{"frame": 0, "crop": [...]}, ...]}，
+    此时可省略 crop。可选的 "outputs" 列表描述同一次解码中的其他输出，每项可包含 crop、mode、
+    width、height 和用于文件名的 name，缺省字段沿用顶层配置。
+    """
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)
+    if "crop" not in spec and "track" not in spec:
+        raise ValueError(f"裁切配置缺少 crop 字段: {path}")
+    return spec
+
+
+def plan_variants(crop_coords, sizes, spec, square):
+    """多路输出列表 [(文件名标签, 裁切区域, 输出尺寸)]
+
+    sizes 为同一裁切区域的额外宽度，spec 中的 "outputs" 可指定各自的裁切区域。
+    """
+    variants = []
+    for size in sizes:
+        size = compute_target_size(crop_coords, size, 0, square)
+        variants.append((f"{size[0]}x{size[1]}", crop_coords, size))
+    for extra in spec.get("outputs", []):
+        extra_crop = extra.get("crop", crop_coords)
+        size = compute_target_size(
+            extra_crop,
+            extra.get("width", 0),
+            extra.get("height", 0),
+            extra.get("mode", spec.get("mode")) == "square",
+        )
+        tag = extra.get("name") or "x".join(str(v) for v in size or extra_crop)
+        variants.append((tag, extra_crop, size))
+    return variants
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="批量裁切视频（无界面）")
+    parser.add_argument("inputs", nargs="+", help="输入视频路径或通配符")
+    parser.add_argument("--crop", type=parse_crop, help="裁切区域 x1,y1,x2,y2")
+    parser.add_argument(
+        "--auto-crop",
+        action="store_true",
+        help="对每个输入抽样检测黑边和画面活跃区域，自动确定裁切区域",
+    )
+    parser.add_argument("--crop-spec", help="JSON 裁切配置文件")
+    parser.add_argument("--width", type=int, default=0, help="输出宽度")
+    parser.add_argument("--height", type=int, default=0, help="输出高度")
+    parser.add_argument("--square", action="store_true", help="1:1 正方形模式")
+    parser.add_argument("-o", "--output-dir", help="输出目录，默认与输入相同")
+    parser.add_argument("-j", "--jobs", type=int, help="并发进程数")
+    parser.add_argument(
+        "--audio", choices=["auto", "copy", "aac"], default="auto", help="音频处理方式"
+    )
+    parser.add_argument("--threads", type=int, default=4, help="每个编码器的线程数")
+    parser.add_argument("--workers", type=int, help="每个任务的裁切/缩放线程数")
+    parser.add_argument(
+        "--max-buffer-mb", type=int, default=256, help="每个任务缓存帧的内存上限(MB)"
+    )
+    parser.add_argument(
+        "--segments", type=int, default=1, help="按关键帧分段并行编码的段数"
+    )
+    parser.add_argument(
+        "--resumable",
+        action="store_true",
+        help="按分钟级分段并记录日志，中断后重新运行同一命令从断点继续",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda text: [int(v) for v in text.split(",") if v],
+        default=[],
+        help="同一裁切区域额外输出的宽度列表，如 720,480（一次解码）",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["opencv", "ffmpeg"],
+        default="opencv",
+        help="ffmpeg 表示在 YUV 帧上原生裁切缩放，不做颜色空间转换",
+    )
+    parser.add_argument("--start", type=parse_time, help="入点，如 90 或 1:30")
+    parser.add_argument("--end", type=parse_time, help="出点，如 2:00")
+    parser.add_argument(
+        "--profile",
+        choices=sorted(PROFILES),
+        default="default",
+        help="编码配置：fast 快速出片，archive 存档质量，small 小体积",
+    )
+    parser.add_argument(
+        "--auto-tune",
+        action="store_true",
+        help="用实际裁切画面试编码，自动选择满足 --target-fps/--max-kbps 的参数",
+    )
+    parser.add_argument("--target-fps", type=float, help="自动调优的编码速度目标")
+    parser.add_argument("--max-kbps", type=float, help="自动调优的码率上限")
+    parser.add_argument(
+        "--frame-store",
+        action="store_true",
+        help="把输入完整解码一次存为内存映射的原始帧，反复试验裁切时不再解码",
+    )
+    parser.add_argument(
+        "--frame-store-dir",
+        help=f"解码帧存储目录（指定即启用），默认 {DEFAULT_STORE_DIR}",
+    )
+    parser.add_argument(
+        "--frame-store-mb",
+        type=int,
+        default=20 * 1024,
+        help="解码帧存储的容量上限，超出时淘汰最久未使用的素材",
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        metavar="PATH",
+        help="把各任务的开始/进度/结束等指标事件追加写入 JSON Lines 文件",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="复用相同输入和参数的已有导出结果",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=f"导出缓存目录（指定即启用缓存），默认 {DEFAULT_CACHE_DIR}",
+    )
+    parser.add_argument(
+        "--cache-size-mb",
+        type=int,
+        default=5 * 1024,
+        help="导出缓存的容量上限，超出时淘汰最久未使用的结果",
+    )
+    return parser
+
+
+def build_jobs(parser, args):
+    """根据命令行参数为每个输入生成任务，返回 (任务列表, 输入数, 失败数)
+
+    参数错误时通过 parser.error 退出。
+    """
+    # 命令行参数优先于配置文件
+    spec = load_crop_spec(args.crop_spec) if args.crop_spec else {}
+    auto = args.auto_crop or (not args.crop and spec.get("crop") == "auto")
+    crop_track = None
+    if "track" in spec and not (args.crop or auto):
+        crop_track = CropTrack.from_spec(spec["track"])
+    crop_coords = args.crop or (None if auto else spec.get("crop"))
+    if crop_track is not None:
+        crop_coords = crop_track.first_crop
+    if not crop_coords and not auto:
+        parser.error("必须通过 --crop、--crop-spec 或 --auto-crop 指定裁切区域")
+    square = args.square or spec.get("mode") == "square"
+    width = args.width or spec.get("width", 0)
+    height = args.height or spec.get("height", 0)
+
+    inputs = expand_inputs(args.inputs)
+    if not inputs:
+        parser.error("没有匹配的输入文件")
+    if args.auto_tune and not (args.target_fps or args.max_kbps):
+        parser.error("--auto-tune 需要 --target-fps 或 --max-kbps")
+
+    frame_store = None
+    if args.frame_store or args.frame_store_dir:
+        frame_store = FrameStore(
+            args.frame_store_dir or DEFAULT_STORE_DIR,
+            args.frame_store_mb * 1024 * 1024,
+        )
+
+    jobs = []
+    failed = 0
+    for path in inputs:
+        if auto:
+            try:
+                crop_coords = auto_crop.suggest_crop(path, square)
+            except RuntimeError as e:
+                failed += 1
+                print(f"[失败] {path}: {e}")
+                continue
+            print(f"[自动裁切] {path}: {','.join(str(v) for v in crop_coords)}")
+        target_size = compute_target_size(crop_coords, width, height, square)
+        variants = plan_variants(crop_coords, args.sizes, spec, square)
+        encoder, threads = PROFILES[args.profile], args.threads
+        if args.auto_tune:
+            # 结果按机器和输出分辨率缓存，同尺寸的后续输入不再重复测试
+            encoder, threads = auto_tune(
+                path, crop_coords, target_size, args.target_fps, args.max_kbps
+            )
+            print(
+                f"[调优] {path}: preset={encoder.preset} crf={encoder.crf} "
+                f"threads={threads}"
+            )
+        output_dir = args.output_dir or os.path.dirname(os.path.abspath(path))
+        os.makedirs(output_dir, exist_ok=True)
+        jobs.append(
+            CropJob(
+                path,
+                default_output_path(path, output_dir),
+                crop_coords,
+                target_size,
+                audio_mode=args.audio,
+                threads=threads,
+                encoder=encoder,
+                workers=args.workers,
+                max_buffer_mb=args.max_buffer_mb,
+                segments=args.segments,
+                resumable=args.resumable,
+                crop_track=crop_track,
+                start_time=args.start,
+                end_time=args.end,
+                engine=args.engine,
+                frame_store=frame_store,
+                extra_outputs=[
+                    OutputSpec(crop, size, default_output_path(path, output_dir, tag))
+                    for tag, crop, size in variants
+                ],
+            )
+        )
+    return jobs, len(inputs), failed
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    jobs, total, failed = build_jobs(parser, args)
+
+    sink = JsonLinesSink(args.metrics_jsonl) if args.metrics_jsonl else None
+    cache = None
+    if args.cache or args.cache_dir:
+        cache = OutputCache(
+            args.cache_dir or DEFAULT_CACHE_DIR, args.cache_size_mb * 1024 * 1024
+        )
+    for job, result in run_batch(jobs, args.jobs, sink, cache):
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"[失败] {job.input_path}: {result}")
+            continue
+        outputs = ", ".join(result.get("outputs", [result["output"]]))
+        tag = "[缓存]" if result.get("cached") else "[完成]"
+        print(
+            f"{tag} {outputs}  {result['frames']} 帧  "
+            f"{result['fps']:.1f} fps  {result['wall_time']:.2f} s  "
+            f"{result['output_bytes'] / 1024 / 1024:.2f} MB"
+        )
+        print(f"       {format_stages(result['metrics'])}")
+    print(f"共 {total} 个任务，失败 {failed} 个")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""动态裁切：在时间轴上设置裁切框关键帧，关键帧之间插值
+
+导出前把每一帧的裁切框预先算成一张紧凑的表，逐帧处理时只需按帧号查表，
+不做任何几何计算；输出尺寸固定，编码器配置全程不变。
+"""
+
+from lazy_modules import LazyModule
+
+np = LazyModule("numpy")
+
+# 插值方式：线性；缓动（smoothstep，关键帧处速度为零）
+EASINGS = ("linear", "ease")
+
+
+class CropTrack:
+    """按帧号排序的裁切框关键帧 [(帧号, (x1, y1, x2, y2))] 与插值方式
+
+    第一个关键帧之前和最后一个关键帧之后保持该关键帧的裁切框。
+    """
+
+    def __init__(self, keyframes, easing="linear"):
+        if not keyframes:
+            raise ValueError("动态裁切至少需要一个关键帧")
+        if easing not in EASINGS:
+            raise ValueError(f"未知的插值方式: {easing}")
+        # 同一帧重复设置时以最后一次为准
+        merged = {int(frame): tuple(int(v) for v in crop) for frame, crop in keyframes}
+        self.keyframes = sorted(merged.items())
+        self.easing = easing
+
+    @property
+    def first_crop(self):
+        return self.keyframes[0][1]
+
+    def table(self, frame_size, first_frame, frame_count):
+        """预计算从 first_frame 起 frame_count 帧的裁切框，返回 uint16 数组
+
+        形状为 (frame_count, 4)，每行为 (x1, y1, 宽, 高)，位置和尺寸分别插值，并平移到画面内
+        （frame_size 为源视频 (宽, 高)），一小时 30fps 的视频约 860 KB。
+        """
+        frames = np.arange(first_frame, first_frame + frame_count, dtype=np.float64)
+        key_frames = np.array([frame for frame, _ in self.keyframes], np.float64)
+        key_rects = np.array(
+            [(x1, y1, x2 - x1, y2 - y1) for _, (x1, y1, x2, y2) in self.keyframes],
+            np.float64,
+        )
+        # 每一帧所在的关键帧区间 [left, left + 1] 及区间内的进度 t
+        right = np.clip(np.searchsorted(key_frames, frames, side="right"), 1, None)
+        right = np.minimum(right, len(key_frames) - 1)
+        left = right - 1
+        span = key_frames[right] - key_frames[left]
+        t = np.divide(
+            frames - key_frames[left],
+            span,
+            out=np.zeros_like(frames),
+            where=span > 0,
+        )
+        t = np.clip(t, 0.0, 1.0)
+        if self.easing == "ease":
+            t = t * t * (3 - 2 * t)
+        rects = key_rects[left] + (key_rects[right] - key_rects[left]) * t[:, None]
+        rects = np.rint(rects)
+
+        width, height = frame_size
+        rects[:, 2] = np.clip(rects[:, 2], 2, width)
+        rects[:, 3] = np.clip(rects[:, 3], 2, height)
+        rects[:, 0] = np.clip(rects[:, 0], 0, width - rects[:, 2])
+        rects[:, 1] = np.clip(rects[:, 1], 0, height - rects[:, 3])
+        return rects.astype(np.uint16)
+
+    def crop_at(self, frame, frame_size):
+        """单帧的裁切框 (x1, y1, x2, y2)，用于预览"""
+        x1, y1, w, h = (int(v) for v in self.table(frame_size, frame, 1)[0])
+        return (x1, y1, x1 + w, y1 + h)
+
+    def to_spec(self):
+        """可写入 JSON 的描述，与 from_spec 对应"""
+        return {
+            "easing": self.easing,
+            "keyframes": [
+                {"frame": frame, "crop": list(crop)} for frame, crop in self.keyframes
+            ],
+        }
+
+    @classmethod
+    def from_spec(cls, spec):
+        keyframes = [(item["frame"], item["crop"]) for item in spec["keyframes"]]
+        return cls(keyframes, spec.get("easing", "linear"))
@@ -0,0 +1,233 @@
+"""编码参数：命名的编码配置，以及按实际裁切画面测速的自动调优
+
+自动调优从视频中部取一小段裁切缩放后的画面，用不同的 preset/线程数（有体积
+目标时还有不同的 crf）编码为不落盘的 H.264 裸流，测量编码速度和码率，
+选出满足速度或体积目标的最佳参数。结果按机器和输出分辨率缓存，不重复测试。
+"""
+
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+
+from lazy_modules import LazyModule, ffmpeg_binary
+
+cv2 = LazyModule("cv2")
+
+
+class EncoderSettings:
+    """libx264 的 preset 和 crf，None 表示使用编码器默认值（medium / 23）"""
+
+    def __init__(self, preset=None, crf=None):
+        self.preset = preset
+        self.crf = crf
+
+    def ffmpeg_args(self):
+        args = []
+        if self.preset:
+            args += ["-preset", self.preset]
+        if self.crf is not None:
+            args += ["-crf", str(self.crf)]
+        return args
+
+    def to_spec(self):
+        return {"preset": self.preset, "crf": self.crf}
+
+
+PROFILES = {
+    "default": EncoderSettings(),
+    # 快速出片：编码速度优先
+    "fast": EncoderSettings("veryfast", 23),
+    # 存档质量：接近视觉无损，编码较慢
+    "archive": EncoderSettings("slow", 18),
+    # 小体积：更高压缩率，画质有所下降
+    "small": EncoderSettings("slower", 28),
+}
+
+# 调优候选，按编码速度从快到慢排列
+TUNE_PRESETS = ("ultrafast", "veryfast", "faster", "medium", "slow")
+# 有体积目标时尝试的 crf，按画质从高到低排列
+TUNE_CRFS = (20, 23, 26, 29)
+TUNE_SAMPLE_FRAMES = 60
+TUNE_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "square_crop", "encoder_tune.json"
+)
+
+
+def read_sample(input_path, crop, target_size, frames=TUNE_SAMPLE_FRAMES):
+    """从视频中部读取一段裁切（和缩放）后的 BGR 帧，返回 (帧列表, fps)"""
+    cap = cv2.VideoCapture(input_path)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError(f"无法打开视频文件: {input_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.set(cv2.CAP_PROP_POS_FRAMES, max(0, total // 2 - frames // 2))
+        x1, y1, x2, y2 = crop
+        sample = []
+        while len(sample) < frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame = frame[y1:y2, x1:x2]
+            if target_size:
+                frame = cv2.resize(frame, target_size)
+            sample.append(frame.copy())
+    finally:
+        cap.release()
+    if not sample:
+        raise RuntimeError(f"无法读取视频画面: {input_path}")
+    return sample, fps
+
+
+def measure_encode(frames, fps, settings, threads):
+    """把样本帧编码为 H.264 裸流（不落盘），返回 (编码 fps, 码率 kbps)"""
+    height, width = frames[0].shape[:2]
+    cmd = [
+        ffmpeg_binary(),
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "bgr24",
+        "-s",
+        f"{width}x{height}",
+        "-r",
+        f"{fps:.6f}",
+        "-i",
+        "-",
+        "-c:v",
+        "libx264",
+        "-vf",
+        "crop=trunc(iw/2)*2:trunc(ih/2)*2",
+        "-pix_fmt",
+        "yuv420p",
+        "-threads",
+        str(threads),
+        *settings.ffmpeg_args(),
+        "-f",
+        "h264",
+        "pipe:1",
+    ]
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+
+    # 写入和读取分开，避免两端管道同时写满而互相等待
+    def feed():
+        try:
+            for frame in frames:
+                proc.stdin.write(frame.data)
+        except BrokenPipeError:
+            pass
+        finally:
+            proc.stdin.close()
+
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
+    encoded = proc.stdout.read()
+    writer.join()
+    if proc.wait() != 0:
+        raise RuntimeError(f"编码测试失败: {settings.to_spec()}")
+    elapsed = time.perf_counter() - start
+    duration = len(frames) / fps
+    return len(frames) / elapsed, len(encoded) * 8 / duration / 1000
+
+
+def choose_settings(results, target_fps=None, max_kbps=None):
+    """从测试结果 [(设置, 线程数, fps, kbps)] 中选择
+
+    满足目标的候选中优先画质（crf 低），其次压缩率（码率低）；只有体积目标时
+    画质相同取最快的。都达不到时：有速度目标取最快的，否则取码率最低的。
+    """
+    candidates = [
+        r
+        for r in results
+        if (target_fps is None or r[2] >= target_fps)
+        and (max_kbps is None or r[3] <= max_kbps)
+    ]
+    if not candidates:
+        if target_fps is not None:
+            return max(results, key=lambda r: r[2])
+        return min(results, key=lambda r: r[3])
+    if target_fps is None:
+        return min(candidates, key=lambda r: (r[0].crf or 23, -r[2]))
+    return min(candidates, key=lambda r: (r[0].crf or 23, r[3]))
+
+
+def tune_key(size, target_fps, max_kbps):
+    """缓存键：机器（主机名、核数）、输出分辨率和目标"""
+    return (
+        f"{socket.gethostname()}|{os.cpu_count()}|{size[0]}x{size[1]}"
+        f"|fps={target_fps}|kbps={max_kbps}"
+    )
+
+
+def load_tune_cache(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_tune_cache(path, cache):
+    """先写临时文件再替换，并发的调优进程不会读到写了一半的文件"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(temp, path)
+
+
+def auto_tune(
+    input_path,
+    crop,
+    target_size=None,
+    target_fps=None,
+    max_kbps=None,
+    cache_path=TUNE_CACHE_PATH,
+):
+    """按速度目标（fps）或体积目标（kbps）选择编码参数
+
+    返回 (EncoderSettings, 线程数)。
+    """
+    x1, y1, x2, y2 = crop
+    size = tuple(target_size) if target_size else (x2 - x1, y2 - y1)
+    key = tune_key(size, target_fps, max_kbps)
+    cache = load_tune_cache(cache_path)
+    if key in cache:
+        entry = cache[key]
+        return EncoderSettings(entry["preset"], entry["crf"]), entry["threads"]
+
+    frames, fps = read_sample(input_path, crop, target_size)
+    cores = os.cpu_count() or 1
+    thread_options = sorted({cores, max(1, cores // 2)}) if target_fps else [cores]
+    crfs = TUNE_CRFS if max_kbps else (23,)
+    results = []
+    for threads in thread_options:
+        for crf in crfs:
+            for preset in TUNE_PRESETS:
+                settings = EncoderSettings(preset, crf)
+                encode_fps, kbps = measure_encode(frames, fps, settings, threads)
+                results.append((settings, threads, encode_fps, kbps))
+                # 更慢的 preset 只会更慢，达不到速度目标后不再继续
+                if target_fps is not None and encode_fps < target_fps:
+                    break
+
+    settings, threads, encode_fps, kbps = choose_settings(results, target_fps, max_kbps)
+    # 测试期间其他进程可能已写入别的条目，重新读取后合并
+    cache = load_tune_cache(cache_path)
+    cache[key] = {
+        "preset": settings.preset,
+        "crf": settings.crf,
+        "threads": threads,
+        "fps": round(encode_fps, 1),
+        "kbps": round(kbps, 1),
+    }
+    save_tune_cache(cache_path, cache)
+    return settings, threads
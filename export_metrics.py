@@ -0,0 +1,163 @@
+"""导出过程的计时与计数
+
+各阶段（打开/探测、解码、裁切、缩放、编码、音频、封装）的累计耗时，帧计数、
+队列深度等指标，以结构化事件的形式交给回调（例如写成 JSON Lines），
+导出结束后汇总为每个任务一份摘要。
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 摘要中各阶段的显示顺序
+STAGES = (
+    "cache",
+    "store",
+    "open",
+    "audio_probe",
+    "decode",
+    "crop",
+    "resize",
+    "encode",
+    "finalize",
+    "mux",
+    "ffmpeg",
+)
+
+
+class JsonLinesSink:
+    """把事件追加写入 JSON Lines 文件
+
+    每个事件单独打开文件追加一行，多个进程写同一个文件时各行不会交错，
+    对象本身只保存路径，可以传给进程池中的子进程。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, event):
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class ExportMetrics:
+    """一次导出任务的指标，线程安全
+
+    sink(event) 接收结构化事件；progress_interval 秒内最多发出一次进度事件。
+    """
+
+    def __init__(self, job_id=None, sink=None, progress_interval=1.0):
+        self.job_id = job_id
+        self.sink = sink
+        self.progress_interval = progress_interval
+        self.started = time.perf_counter()
+        self._timings = defaultdict(float)
+        self._calls = defaultdict(int)
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._last_progress = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """对 with 块计时，累计到阶段 name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        with self._lock:
+            self._timings[name] += seconds
+            self._calls[name] += calls
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name, value):
+        """记录瞬时值（如队列深度），摘要中给出最大值和平均值"""
+        with self._lock:
+            last, peak, total, samples = self._gauges.get(name, (0, value, 0, 0))
+            self._gauges[name] = (value, max(peak, value), total + value, samples + 1)
+
+    def emit(self, event, **fields):
+        """发出一个结构化事件"""
+        if self.sink is None:
+            return
+        record = {"event": event, "job": self.job_id, "time": time.time()}
+        record.update(fields)
+        self.sink(record)
+
+    def progress(self, frame_count, total_frames):
+        """按时间间隔节流的进度事件"""
+        now = time.perf_counter()
+        if now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        elapsed = now - self.started
+        self.emit(
+            "progress",
+            frames=frame_count,
+            total_frames=total_frames,
+            fps=round(frame_count / elapsed, 2) if elapsed > 0 else 0.0,
+            stages=self.stage_seconds(),
+        )
+
+    def merge(self, summary):
+        """合并其他进程（如分段导出的子进程）返回的摘要"""
+        for name, stage in summary.get("stages", {}).items():
+            self.add_time(name, stage["seconds"], stage["calls"])
+        for name, value in summary.get("counters", {}).items():
+            self.count(name, value)
+        for name, gauge in summary.get("gauges", {}).items():
+            self.gauge(name, gauge["max"])
+
+    def stage_seconds(self):
+        with self._lock:
+            return {name: round(value, 4) for name, value in self._timings.items()}
+
+    def summary(self):
+        """汇总：各阶段耗时/调用次数/吞吐、计数器、瞬时值统计"""
+        with self._lock:
+            names = [s for s in STAGES if s in self._timings]
+            names += sorted(set(self._timings) - set(STAGES))
+            stages = {}
+            for name in names:
+                seconds = self._timings[name]
+                calls = self._calls[name]
+                stages[name] = {
+                    "seconds": round(seconds, 4),
+                    "calls": calls,
+                    "ms_avg": round(seconds / calls * 1000, 3) if calls else 0.0,
+                    "per_second": round(calls / seconds, 2) if seconds > 0 else 0.0,
+                }
+            gauges = {
+                name: {"last": last, "max": peak, "avg": round(total / samples, 2)}
+                for name, (last, peak, total, samples) in self._gauges.items()
+            }
+            return {
+                "wall_time": round(time.perf_counter() - self.started, 4),
+                "stages": stages,
+                "counters": dict(self._counters),
+                "gauges": gauges,
+            }
+
+    def bottleneck(self):
+        """累计耗时最长的阶段名，没有记录时返回 None"""
+        with self._lock:
+            if not self._timings:
+                return None
+            return max(self._timings, key=self._timings.get)
+
+
+def summary_bottleneck(summary):
+    """摘要中累计耗时最长的阶段名，没有记录时返回 None"""
+    stages = summary.get("stages", {})
+    if not stages:
+        return None
+    return max(stages, key=lambda name: stages[name]["seconds"])
@@ -0,0 +1,218 @@
+"""解码帧存储：把源视频完整解码一次为原始 BGR 帧文件，之后通过内存映射读取
+
+同一素材反复尝试不同裁切或尺寸时，预览和导出直接从映射的帧文件中取 NumPy 视图，
+不再解码压缩视频；适合 ProRes、8K 等解码代价远高于读取的短素材。
+
+每个条目是存储目录下以源文件身份（路径、大小、修改时间）命名的子目录：
+frames.bgr 为按顺序排列的 bgr24 帧，index.npy 为每帧的 (字节偏移, 时间戳微秒)，
+meta.json 记录尺寸、帧率和帧数。总占用超过上限时按最近使用时间淘汰。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+from lazy_modules import LazyModule
+from output_cache import LruDirectory
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+DEFAULT_STORE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "square_crop", "frames"
+)
+DEFAULT_MAX_BYTES = 20 * 1024**3
+FRAMES_NAME = "frames.bgr"
+INDEX_NAME = "index.npy"
+META_NAME = "meta.json"
+
+
+def source_key(path):
+    """源文件身份摘要，文件被替换或修改后自动失效"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    identity = f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()[:24]
+
+
+class StoredFrames:
+    """一个已解码条目的只读内存映射，frames[i] 为第 i 帧的 (高, 宽, 3) 视图"""
+
+    def __init__(self, entry):
+        with open(os.path.join(entry, META_NAME), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.width = meta["width"]
+        self.height = meta["height"]
+        self.fps = meta["fps"]
+        self.frame_count = meta["frames"]
+        self.index = np.load(os.path.join(entry, INDEX_NAME))
+        self.frames = np.memmap(
+            os.path.join(entry, FRAMES_NAME),
+            dtype=np.uint8,
+            mode="r",
+            shape=(self.frame_count, self.height, self.width, 3),
+        )
+
+    def capture(self):
+        """返回 cv2.VideoCapture 接口的读取器，可直接替换解码句柄"""
+        return StoredCapture(self)
+
+
+class StoredCapture:
+    """在 StoredFrames 上模拟 cv2.VideoCapture 的读取、跳转和属性查询
+
+    read() 返回映射中的视图而不复制，传入的 image 缓冲被忽略。
+    """
+
+    def __init__(self, stored):
+        self.stored = stored
+        self.position = 0
+        self._grabbed = None
+
+    def isOpened(self):
+        return self.stored is not None
+
+    def get(self, prop):
+        stored = self.stored
+        if prop == cv2.CAP_PROP_FPS:
+            return stored.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return stored.frame_count
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return stored.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return stored.height
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            if self.position >= stored.frame_count:
+                return self.position / stored.fps * 1000
+            return stored.index[self.position, 1] / 1000
+        return 0.0
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self.position = max(0, min(int(value), self.stored.frame_count))
+        return True
+
+    def grab(self):
+        if self.position >= self.stored.frame_count:
+            self._grabbed = None
+            return False
+        self._grabbed = self.position
+        self.position += 1
+        return True
+
+    def retrieve(self, image=None):
+        if self._grabbed is None:
+            return False, None
+        return True, self.stored.frames[self._grabbed]
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        self.stored = None
+
+
+class FrameStore(LruDirectory):
+    """解码帧存储，open 只读取已有条目，load 在缺失时先完整解码"""
+
+    def __init__(self, root=DEFAULT_STORE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(root, max_bytes)
+
+    def open(self, path):
+        """返回已有条目的 StoredFrames，不存在时返回 None"""
+        key = source_key(path)
+        try:
+            stored = StoredFrames(self.entry_dir(key))
+        except (OSError, ValueError, KeyError):
+            return None
+        self.touch(key)
+        return stored
+
+    def load(self, path, cancel_event=None):
+        """返回 StoredFrames，条目不存在时解码整个源视频生成
+
+        预计大小超过存储上限时抛出 ValueError。多个进程同时请求同一素材时
+        只有一个解码，其余等待后直接读取。
+        """
+        stored = self.open(path)
+        if stored is not None:
+            return stored
+        key = source_key(path)
+        lock = self.lock(key)
+        while not lock.try_acquire():
+            if cancel_event is not None and cancel_event.is_set():
+                raise InterruptedError("解码已取消")
+            time.sleep(0.5)
+        try:
+            stored = self.open(path)
+            if stored is None:
+                self.build(path, key, cancel_event)
+                stored = self.open(path)
+        finally:
+            lock.release()
+        if stored is None:
+            raise RuntimeError(f"无法读取解码帧存储: {path}")
+        return stored
+
+    def build(self, path, key, cancel_event=None):
+        cap = cv2.VideoCapture(path)
+        try:
+            if not cap.isOpened():
+                raise RuntimeError(f"无法打开视频文件: {path}")
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            frame_bytes = width * height * 3
+            estimated = frame_bytes * int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if estimated > self.max_bytes:
+                raise ValueError(
+                    f"解码后约 {estimated / 1024**3:.1f} GB，超出帧存储上限 "
+                    f"{self.max_bytes / 1024**3:.1f} GB: {path}"
+                )
+            # 先腾出空间，避免写到一半磁盘占满
+            self.evict(self.max_bytes - estimated)
+
+            os.makedirs(self.root, exist_ok=True)
+            temp = os.path.join(self.root, f".tmp-{key}-{uuid.uuid4().hex}")
+            os.makedirs(temp)
+            try:
+                index = []
+                buffer = np.empty((height, width, 3), np.uint8)
+                with open(os.path.join(temp, FRAMES_NAME), "wb") as f:
+                    while True:
+                        if cancel_event is not None and cancel_event.is_set():
+                            raise InterruptedError("解码已取消")
+                        ret, frame = cap.read(buffer)
+                        if not ret:
+                            break
+                        pts = int(round(cap.get(cv2.CAP_PROP_POS_MSEC) * 1000))
+                        index.append((len(index) * frame_bytes, pts))
+                        f.write(frame.data)
+                if not index:
+                    raise RuntimeError(f"无法读取视频画面: {path}")
+                np.save(os.path.join(temp, INDEX_NAME), np.array(index, dtype=np.int64))
+                meta = {
+                    "source": os.path.abspath(path),
+                    "width": width,
+                    "height": height,
+                    "fps": fps,
+                    "frames": len(index),
+                }
+                with open(os.path.join(temp, META_NAME), "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+                os.rename(temp, self.entry_dir(key))
+            finally:
+                if os.path.exists(temp):
+                    shutil.rmtree(temp, ignore_errors=True)
+        finally:
+            cap.release()
+        self.evict()
@@ -0,0 +1,51 @@
+"""按需导入：cv2、NumPy、PIL、moviepy 等较重的依赖在第一次使用时才加载
+
+界面窗口、命令行 --help 和短时运行的批处理进程因此不必在启动时付出数百毫秒的导入开销。
+"""
+
+import importlib
+import threading
+
+
+class LazyModule:
+    """模块代理，第一次访问属性时才导入真正的模块
+
+    取到的属性缓存在代理自身上，热循环中的 cv2.resize 等之后不再经过 __getattr__。
+    导入由 importlib 的模块锁保护，多个线程同时首次访问也是安全的。
+    代理自身不定义普通方法，以免遮住模块里的同名属性（如 np.load）。
+    """
+
+    def __init__(self, name):
+        self.__dict__["_lazy_name"] = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._lazy_name), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        return f"<lazy module {self._lazy_name!r}>"
+
+
+_moviepy_config = LazyModule("moviepy.config")
+
+
+def ffmpeg_binary():
+    """moviepy 配置的 ffmpeg 可执行文件路径，用到时才导入 moviepy.config"""
+    return _moviepy_config.get_setting("FFMPEG_BINARY")
+
+
+def preload(names):
+    """在后台线程中依次导入模块，界面显示后调用，首次预览或导出时不必再等待"""
+
+    def run():
+        for name in names:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                # 缺少的依赖留到真正使用时再报错
+                pass
+
+    thread = threading.Thread(target=run, name="preload-modules", daemon=True)
+    thread.start()
+    return thread
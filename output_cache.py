@@ -0,0 +1,263 @@
+"""导出结果缓存：相同输入和参数的任务直接复用已有输出
+
+缓存键由输入文件身份（大小、修改时间、首中尾各 1 MB 的摘要）、裁切区域、
+输出尺寸、入点/出点和编码参数计算。每个条目是缓存目录下以键命名的子目录，
+内含各路输出和导出统计 stats.json。命中时把输出硬链接（跨文件系统时复制）
+到目标路径。
+
+并发：同一个键同时只有一个进程导出，其余进程等待锁释放后直接命中；
+条目先在临时目录中写好再整体改名，读者不会看到半成品。
+按目录修改时间做 LRU 淘汰，命中时刷新修改时间。
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import socket
+import time
+import uuid
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "square_crop", "outputs"
+)
+DEFAULT_MAX_BYTES = 5 * 1024**3
+# 编码参数或输出格式变化时递增，使旧条目失效
+CACHE_VERSION = 1
+# 采样摘要的块大小
+HASH_CHUNK = 1024 * 1024
+# 超过该时长的锁视为残留（持有者崩溃等）
+STALE_LOCK_SECONDS = 6 * 3600
+
+STATS_NAME = "stats.json"
+
+
+def fast_file_hash(path):
+    """对文件首、中、尾各 1 MB 和文件大小做摘要，大文件也只需读 3 MB"""
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode("ascii"))
+    offsets = {0, size // 2 - HASH_CHUNK // 2, size - HASH_CHUNK}
+    with open(path, "rb") as f:
+        for offset in sorted({max(0, offset) for offset in offsets}):
+            f.seek(offset)
+            digest.update(f.read(HASH_CHUNK))
+    return digest.hexdigest()
+
+
+def job_key(job):
+    """根据输入身份和影响输出内容的全部参数计算缓存键"""
+    stat = os.stat(job.input_path)
+    outputs = [(job.crop_coords, job.target_size)]
+    outputs += [(spec.crop_coords, spec.target_size) for spec in job.extra_outputs]
+    identity = {
+        "version": CACHE_VERSION,
+        "input": [stat.st_size, stat.st_mtime_ns, fast_file_hash(job.input_path)],
+        "outputs": [
+            [list(crop), list(size) if size else None] for crop, size in outputs
+        ],
+        "track": job.crop_track.to_spec() if job.crop_track else None,
+        "trim": [job.start_time, job.end_time],
+        "audio_mode": job.audio_mode,
+        "engine": job.engine,
+        "encoder": job.encoder.to_spec(),
+        # 分段边界处的 GOP 与整段编码不同
+        "segments": job.segments,
+    }
+    text = json.dumps(identity, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def job_outputs(job):
+    """任务的全部输出路径，顺序与缓存条目中的文件编号一致"""
+    return [job.output_path] + [spec.output_path for spec in job.extra_outputs]
+
+
+def link_or_copy(src, dst):
+    """硬链接 src 到 dst（先删除已有的 dst），跨文件系统时退回复制"""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        shutil.copyfile(src, dst)
+
+
+def detach_output(path):
+    """目标文件与缓存条目共享 inode 时先删除，避免 ffmpeg 截断写入破坏缓存"""
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class CacheLock:
+    """基于 O_CREAT|O_EXCL 锁文件的跨进程互斥锁
+
+    锁文件记录主机名和进程号；同一主机上持有者进程已退出，或锁文件过旧时
+    视为残留并清除。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.owner = f"{socket.gethostname()} {os.getpid()}"
+        self.held = False
+
+    def try_acquire(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            if self._is_stale():
+                self._break()
+                return self.try_acquire()
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(self.owner)
+        self.held = True
+        return True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _is_stale(self):
+        try:
+            with open(self.path) as f:
+                host, _, pid = f.read().partition(" ")
+            age = time.time() - os.path.getmtime(self.path)
+        except (OSError, ValueError):
+            return False
+        if age > STALE_LOCK_SECONDS:
+            return True
+        if host != socket.gethostname() or not pid.isdigit():
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        return False
+
+    def _break(self):
+        # 先改名再删除：多个进程同时判定为残留时只有一个能改名成功
+        trash = f"{self.path}.stale-{uuid.uuid4().hex}"
+        try:
+            os.rename(self.path, trash)
+            os.remove(trash)
+        except FileNotFoundError:
+            pass
+
+
+class LruDirectory:
+    """以键命名的子目录组成的磁盘缓存，按目录修改时间做 LRU 淘汰
+
+    对象只保存路径和上限，可以传给子进程。
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def lock(self, key):
+        os.makedirs(self.root, exist_ok=True)
+        return CacheLock(os.path.join(self.root, key + ".lock"))
+
+    def touch(self, key):
+        """刷新修改时间，作为 LRU 的访问时间"""
+        try:
+            os.utime(self.entry_dir(key))
+        except OSError:
+            pass
+
+    def entries(self):
+        """返回 [(修改时间, 占用字节, 键)]，按最近使用时间从旧到新排序"""
+        result = []
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return result
+        for name in names:
+            entry = os.path.join(self.root, name)
+            if name.startswith(".") or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(
+                    os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry)
+                )
+                result.append((os.path.getmtime(entry), size, name))
+            except OSError:
+                continue
+        result.sort()
+        return result
+
+    def evict(self, max_bytes=None):
+        """删除最久未使用的条目，直到总占用不超过上限，返回删除的条目数"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, key in entries:
+            if total <= max_bytes:
+                break
+            # 改名后再删除，并发命中的读者要么拿到完整条目，要么未命中
+            trash = os.path.join(self.root, f".trash-{key}-{uuid.uuid4().hex}")
+            try:
+                os.rename(self.entry_dir(key), trash)
+            except OSError:
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+
+class OutputCache(LruDirectory):
+    """按内容寻址的导出结果缓存"""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(root, max_bytes)
+
+    def fetch(self, key, output_paths):
+        """命中时把缓存的各路输出链接到 output_paths 并返回保存的统计，否则返回 None"""
+        entry = self.entry_dir(key)
+        try:
+            with open(os.path.join(entry, STATS_NAME), encoding="utf-8") as f:
+                stats = json.load(f)
+            for i, path in enumerate(output_paths):
+                link_or_copy(os.path.join(entry, f"{i}.mp4"), path)
+        except (OSError, ValueError):
+            # 条目不存在、不完整或恰好被淘汰
+            return None
+        self.touch(key)
+        return stats
+
+    def store(self, key, output_paths, stats):
+        """把导出结果放入缓存，已有同键条目时保留已有的"""
+        os.makedirs(self.root, exist_ok=True)
+        temp = os.path.join(self.root, f".tmp-{key}-{uuid.uuid4().hex}")
+        os.makedirs(temp)
+        try:
+            for i, path in enumerate(output_paths):
+                link_or_copy(path, os.path.join(temp, f"{i}.mp4"))
+            with open(os.path.join(temp, STATS_NAME), "w", encoding="utf-8") as f:
+                json.dump(stats, f, ensure_ascii=False)
+            try:
+                os.rename(temp, self.entry_dir(key))
+            except OSError as e:
+                if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+        finally:
+            if os.path.exists(temp):
+                shutil.rmtree(temp, ignore_errors=True)
+        self.evict()
@@ -0,0 +1,298 @@
+"""预览帧读取：常驻的视频句柄 + 按帧序号缓存的 LRU + 后台预取，以及实时播放
+
+两者都可以改为读取解码帧存储（frame_store.StoredFrames），不再解码源视频。
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+from lazy_modules import LazyModule
+
+cv2 = LazyModule("cv2")
+
+# 缓存帧的最大高度：覆盖常见画布尺寸，4K 源的缓存也能容纳足够多的帧
+CACHE_MAX_HEIGHT = 1080
+
+
+def open_capture(path, stored=None):
+    """有解码帧存储时返回内存映射读取器，否则打开源视频"""
+    return stored.capture() if stored is not None else cv2.VideoCapture(path)
+
+
+def cache_size_for(width, height, max_height=CACHE_MAX_HEIGHT):
+    """缓存帧的固定尺寸：源（或代理）分辨率，高度超过 max_height 时等比缩小"""
+    if height <= max_height:
+        return (width, height)
+    return (max(1, round(width * max_height / height)), max_height)
+
+
+def read_display_frame(cap, index, next_index, size):
+    """从 cap 读取第 index 帧并缩小为 RGB 图像，返回 (图像或 None, 下一帧序号)
+
+    next_index 为 cap 当前的解码位置，只有不连续时才 seek，顺序读取比跳转便宜得多。
+    """
+    if index != next_index:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+    ret, frame = cap.read()
+    if not ret:
+        return None, -1
+    if (frame.shape[1], frame.shape[0]) != tuple(size):
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), index + 1
+
+
+class FrameCache:
+    """按占用字节数限制大小的 LRU 帧缓存，线程安全"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+            return frame
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames
+
+    def put(self, key, frame):
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return
+            self._frames[key] = frame
+            self.used_bytes += frame.nbytes
+            # 超出上限时淘汰最久未使用的帧
+            while self.used_bytes > self.max_bytes and len(self._frames) > 1:
+                _, old = self._frames.popitem(last=False)
+                self.used_bytes -= old.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.used_bytes = 0
+
+
+class PreviewSource:
+    """为预览画布提供任意帧的缩小 RGB 图像
+
+    前台读取与后台预取各自持有一个 VideoCapture，互不打断对方的解码位置。
+    缓存键只有帧序号，帧按固定的缓存尺寸保存，取帧时再缩放到画布尺寸，
+    画布大小变化后重绘也直接命中缓存，不再解码。
+    读取代理文件时用 original_size 传入原始视频尺寸，裁切坐标仍按原始分辨率换算。
+    """
+
+    def __init__(
+        self,
+        path,
+        max_cache_mb=128,
+        prefetch_radius=12,
+        original_size=None,
+        stored=None,
+    ):
+        self.path = path
+        self.stored = stored
+        self.cap = open_capture(path, stored)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"无法打开视频文件: {path}")
+        self.frame_count = max(1, int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.original_size = original_size or (
+            int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+        self.cache_size = cache_size_for(
+            int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+        self.cache = FrameCache(max_cache_mb * 1024 * 1024)
+        self.prefetch_radius = prefetch_radius
+        self._next_index = 0
+        self._cap_lock = threading.Lock()
+
+        # 后台预取状态
+        self._prefetch_target = None
+        self._prefetch_wakeup = threading.Event()
+        self._closed = False
+        self._prefetch_thread = threading.Thread(
+            target=self._prefetch_loop, name="preview-prefetch", daemon=True
+        )
+        self._prefetch_thread.start()
+
+    def get_frame(self, index, size):
+        """返回第 index 帧缩放到 size 的 RGB 图像，读取失败返回 None"""
+        index = max(0, min(index, self.frame_count - 1))
+        frame = self.cache.get(index)
+        if frame is None:
+            with self._cap_lock:
+                frame, self._next_index = read_display_frame(
+                    self.cap, index, self._next_index, self.cache_size
+                )
+            if frame is None:
+                return None
+            self.cache.put(index, frame)
+        if tuple(size) == self.cache_size:
+            return frame
+        return cv2.resize(frame, tuple(size), interpolation=cv2.INTER_AREA)
+
+    def prefetch(self, index):
+        """在后台解码 index 附近的帧，供连续拖动时命中缓存"""
+        self._prefetch_target = index
+        self._prefetch_wakeup.set()
+
+    def close(self):
+        self._closed = True
+        self._prefetch_wakeup.set()
+        self._prefetch_thread.join(timeout=1)
+        with self._cap_lock:
+            self.cap.release()
+        self.cache.clear()
+
+    def _prefetch_loop(self):
+        cap = open_capture(self.path, self.stored)
+        next_index = 0
+        try:
+            while not self._closed:
+                self._prefetch_wakeup.wait()
+                self._prefetch_wakeup.clear()
+                if self._closed or self._prefetch_target is None:
+                    continue
+                target = index = self._prefetch_target
+                # 先向后（拖动方向通常向后），再向前
+                start = max(0, index - self.prefetch_radius)
+                end = min(self.frame_count, index + self.prefetch_radius + 1)
+                for i in list(range(index + 1, end)) + list(range(start, index)):
+                    # 目标变化时放弃本轮，转去新的位置附近
+                    if self._closed or self._prefetch_target != target:
+                        break
+                    if i in self.cache:
+                        continue
+                    frame, next_index = read_display_frame(
+                        cap, i, next_index, self.cache_size
+                    )
+                    if frame is None:
+                        break
+                    self.cache.put(i, frame)
+        finally:
+            cap.release()
+
+
+class PlaybackSource:
+    """实时播放：后台线程顺序解码、缩小，写入小环形缓冲
+
+    界面线程用 frame_due() 按墙钟时间取帧，过期的帧直接丢弃；解码跟不上时
+    解码线程只 grab 不转换缩放，跳过已过期的帧，播放进度始终跟随墙钟。
+    crop_for(帧号) 返回原始分辨率下的裁切框时播放裁切结果，否则播放整个画面。
+    读取代理文件时用 original_size 传入原始视频尺寸，用于换算裁切框。
+    """
+
+    def __init__(
+        self,
+        path,
+        start_frame,
+        size,
+        fps,
+        original_size=None,
+        crop_for=None,
+        ring_size=6,
+        stored=None,
+    ):
+        self.path = path
+        self.stored = stored
+        self.start_frame = start_frame
+        self.size = tuple(size)
+        self.fps = fps
+        self.original_size = original_size
+        self.crop_for = crop_for
+        self.ring_size = ring_size
+        # 解码线程来不及解码和界面取帧时丢弃的帧数
+        self.dropped = 0
+        self.ended = False
+        self._ring = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._started = 0.0
+        self._thread = threading.Thread(
+            target=self._decode_loop, name="preview-playback", daemon=True
+        )
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout=1)
+
+    @property
+    def finished(self):
+        """解码到文件末尾且缓冲中的帧都已取走"""
+        return self.ended and not self._ring
+
+    def due_index(self):
+        """按墙钟时间此刻应显示的帧号"""
+        return self.start_frame + int((time.perf_counter() - self._started) * self.fps)
+
+    def frame_due(self):
+        """取出此刻应显示的最新一帧 (帧号, RGB 图像)，更早的帧丢弃；没有新帧返回 None"""
+        due = self.due_index()
+        latest = None
+        with self._cond:
+            while self._ring and self._ring[0][0] <= due:
+                if latest is not None:
+                    self.dropped += 1
+                latest = self._ring.popleft()
+            if latest is not None:
+                self._cond.notify()
+        return latest
+
+    def _prepare(self, frame, index, scale):
+        if self.crop_for is not None:
+            x1, y1, x2, y2 = self.crop_for(index)
+            sx, sy = scale
+            frame = frame[int(y1 * sy) : int(y2 * sy), int(x1 * sx) : int(x2 * sx)]
+        resized = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+
+    def _decode_loop(self):
+        cap = open_capture(self.path, self.stored)
+        try:
+            width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+            height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+            original_w, original_h = self.original_size or (width, height)
+            scale = (width / original_w, height / original_h)
+            if self.start_frame > 0:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            index = self.start_frame
+            while True:
+                with self._cond:
+                    while len(self._ring) >= self.ring_size and not self._stopped:
+                        self._cond.wait(0.1)
+                    if self._stopped:
+                        break
+                # 落后于墙钟时，已过期的帧只解码不转换，尽快追上
+                while index < self.due_index():
+                    if not cap.grab():
+                        return
+                    index += 1
+                    self.dropped += 1
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                image = self._prepare(frame, index, scale)
+                with self._cond:
+                    self._ring.append((index, image))
+                index += 1
+        finally:
+            cap.release()
+            self.ended = True
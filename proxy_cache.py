@@ -0,0 +1,184 @@
+"""低分辨率代理文件：交互预览和画框使用代理，最终导出仍读取原始视频
+
+代理缓存在源文件旁的 .crop_proxies 目录中，文件名包含源文件路径、大小和
+修改时间的摘要，源文件变化后自动失效。
+
+示例（预先批量生成代理）:
+    python proxy_cache.py "素材/*.mov"
+"""
+
+import glob
+import hashlib
+import os
+import subprocess
+import sys
+import threading
+
+from lazy_modules import LazyModule, ffmpeg_binary
+
+cv2 = LazyModule("cv2")
+
+PROXY_DIR_NAME = ".crop_proxies"
+# 代理的画面高度
+PROXY_HEIGHT = 540
+# 源视频高度达到该值时才值得生成代理
+PROXY_MIN_SOURCE_HEIGHT = 1440
+
+
+def probe_video_size(path):
+    """只读取容器信息获得 (宽, 高)，不解码画面"""
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError(f"无法打开视频文件: {path}")
+        return (
+            int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+    finally:
+        cap.release()
+
+
+def needs_proxy(size):
+    """源视频是否大到值得使用代理"""
+    return size[1] >= PROXY_MIN_SOURCE_HEIGHT
+
+
+def proxy_path_for(source_path, height=PROXY_HEIGHT):
+    """根据源文件身份（路径、大小、修改时间）计算代理文件路径"""
+    source_path = os.path.abspath(source_path)
+    stat = os.stat(source_path)
+    identity = f"{source_path}|{stat.st_size}|{stat.st_mtime_ns}|{height}"
+    digest = hashlib.sha1(identity.encode("utf-8")).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(
+        os.path.dirname(source_path), PROXY_DIR_NAME, f"{stem}_{digest}.mp4"
+    )
+
+
+def find_proxy(source_path, height=PROXY_HEIGHT):
+    """返回已生成的代理路径，不存在时返回 None"""
+    path = proxy_path_for(source_path, height)
+    return path if os.path.exists(path) else None
+
+
+def proxy_command(source_path, output_path, height=PROXY_HEIGHT):
+    """生成代理的 ffmpeg 命令：短 GOP 方便随机跳帧，保留每一帧以保证帧号对应"""
+    return [
+        ffmpeg_binary(),
+        "-y",
+        "-loglevel",
+        "error",
+        "-i",
+        source_path,
+        "-map",
+        "0:v:0",
+        "-an",
+        "-vsync",
+        "0",
+        "-vf",
+        f"scale=-2:{height}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-crf",
+        "28",
+        "-g",
+        "12",
+        "-pix_fmt",
+        "yuv420p",
+        output_path,
+    ]
+
+
+class ProxyBuilder:
+    """在后台线程中生成代理文件，完成后 done 置位"""
+
+    def __init__(self, source_path, height=PROXY_HEIGHT):
+        self.source_path = source_path
+        self.proxy_path = proxy_path_for(source_path, height)
+        self.height = height
+        self.error = None
+        self.done = threading.Event()
+        self._proc = None
+        self._cancelled = False
+        # 保护 _proc 和 _cancelled：cancel 可能在子进程启动前后任意时刻调用
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="proxy-builder", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """放弃生成，清理未完成的文件"""
+        with self._lock:
+            self._cancelled = True
+            proc = self._proc
+        if proc and proc.poll() is None:
+            proc.kill()
+
+    def _run(self):
+        # 先写临时文件再改名，避免其他进程读到半成品
+        temp_path = self.proxy_path + ".part.mp4"
+        try:
+            os.makedirs(os.path.dirname(self.proxy_path), exist_ok=True)
+            with self._lock:
+                if self._cancelled:
+                    return
+            proc = subprocess.Popen(
+                proxy_command(self.source_path, temp_path, self.height),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            # 启动期间调用的 cancel 看不到子进程，由这里终止
+            with self._lock:
+                self._proc = proc
+                cancelled = self._cancelled
+            if cancelled:
+                proc.kill()
+            _, stderr = proc.communicate()
+            if self._cancelled:
+                return
+            if proc.returncode != 0:
+                message = stderr.decode("utf-8", "replace").strip()
+                raise RuntimeError(f"代理生成失败: {message}")
+            os.replace(temp_path, self.proxy_path)
+        except Exception as e:
+            self.error = e
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            self.done.set()
+
+
+def build_proxy(source_path, height=PROXY_HEIGHT):
+    """同步生成代理（已存在时直接返回），返回代理路径"""
+    existing = find_proxy(source_path, height)
+    if existing:
+        return existing
+    builder = ProxyBuilder(source_path, height).start()
+    builder.done.wait()
+    if builder.error:
+        raise builder.error
+    return builder.proxy_path
+
+
+def main(argv=None):
+    patterns = sys.argv[1:] if argv is None else argv
+    failed = 0
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            try:
+                print(f"[完成] {build_proxy(path)}")
+            except Exception as e:
+                failed += 1
+                print(f"[失败] {path}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""导出质量评估：把源视频按同样的裁切/缩放得到参考画面，与导出文件逐帧对比
+
+两路视频同步解码，每次取一组帧（默认 16 帧）叠成亮度数组：PSNR 在整组上一次算出，
+SSIM（11×11 高斯窗口）把一组帧作为多通道图像交给 cv2.GaussianBlur 批量滤波。
+两者都只计算亮度，与编码器评测的惯例（如 ffmpeg psnr 滤镜的 Y 分量）一致，
+不受 yuv420p 色度下采样在合成画面锐利色块上放大的误差影响。
+
+示例:
+    python quality_metrics.py 素材.mp4 输出/cropped_素材.mp4 --crop 420,0,1500,1080 --width 720
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from crop_engine import parse_crop
+
+# 完全相同的帧 PSNR 为无穷大，统计时按该值计
+PSNR_CAP = 100.0
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+# BGR -> 亮度（BT.601）
+LUMA_WEIGHTS = np.array([0.114, 0.587, 0.299], np.float32)
+# cv2 滤波函数支持的最大通道数
+MAX_BLOCK = 512
+
+
+def read_block(cap, count, transform=None):
+    """顺序读取至多 count 帧（可先经 transform 处理），返回帧列表"""
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(transform(frame) if transform else frame)
+    return frames
+
+
+def crop_transform(crop, target_size=None):
+    """与导出相同的裁切和缩放（cv2.resize 默认双线性插值）"""
+    x1, y1, x2, y2 = crop
+
+    def transform(frame):
+        cropped = frame[y1:y2, x1:x2]
+        if target_size:
+            return cv2.resize(cropped, tuple(target_size))
+        return cropped
+
+    return transform
+
+
+def luma_blocks(reference, test):
+    """把两组 BGR 帧裁到公共尺寸，转为 (高, 宽, N) 的 float32 亮度数组
+
+    导出时奇数宽高会被裁掉一个像素以满足 yuv420p，对比时只取两者共有的区域。
+    帧序号放在最后一维，一组帧可以作为多通道图像一起滤波。
+    """
+    height = min(reference[0].shape[0], test[0].shape[0])
+    width = min(reference[0].shape[1], test[0].shape[1])
+
+    def stack(frames):
+        block = np.stack([frame[:height, :width] for frame in frames])
+        return np.ascontiguousarray(np.moveaxis(block @ LUMA_WEIGHTS, 0, -1))
+
+    return stack(reference), stack(test)
+
+
+def block_psnr(x, y):
+    """一组帧的逐帧亮度 PSNR（dB）"""
+    diff = x - y
+    mse = np.mean(diff * diff, axis=(0, 1))
+    with np.errstate(divide="ignore"):
+        psnr = 10 * np.log10(255.0**2 / mse)
+    return np.minimum(psnr, PSNR_CAP)
+
+
+def block_ssim(x, y):
+    """一组帧的逐帧亮度 SSIM"""
+
+    def blur(image):
+        blurred = cv2.GaussianBlur(image, (11, 11), 1.5)
+        # 单帧时 cv2 会去掉通道维
+        return blurred.reshape(image.shape)
+
+    mu_x = blur(x)
+    mu_y = blur(y)
+    mu_xx = mu_x * mu_x
+    mu_yy = mu_y * mu_y
+    mu_xy = mu_x * mu_y
+    sigma_xx = blur(x * x) - mu_xx
+    sigma_yy = blur(y * y) - mu_yy
+    sigma_xy = blur(x * y) - mu_xy
+    ssim_map = ((2 * mu_xy + SSIM_C1) * (2 * sigma_xy + SSIM_C2)) / (
+        (mu_xx + mu_yy + SSIM_C1) * (sigma_xx + sigma_yy + SSIM_C2)
+    )
+    return ssim_map.mean(axis=(0, 1))
+
+
+def compare_videos(
+    reference_path,
+    test_path,
+    crop=None,
+    target_size=None,
+    start_frame=0,
+    block=16,
+    max_frames=None,
+    per_frame=False,
+):
+    """对比参考视频（经 crop/target_size 处理）与导出视频，返回质量统计
+
+    参考从 start_frame 开始（对应导出时的入点），两路读取在两个线程中并行。
+    帧数不同时只对比较短的一路，差值记为 frame_mismatch。
+    """
+    block = max(1, min(block, MAX_BLOCK))
+    reference_cap = cv2.VideoCapture(reference_path)
+    test_cap = cv2.VideoCapture(test_path)
+    if not reference_cap.isOpened():
+        raise RuntimeError(f"无法打开视频文件: {reference_path}")
+    if not test_cap.isOpened():
+        raise RuntimeError(f"无法打开视频文件: {test_path}")
+    if start_frame:
+        reference_cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    transform = crop_transform(crop, target_size) if crop else None
+
+    psnr_values = []
+    ssim_values = []
+    compared = 0
+    extra_frames = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            while max_frames is None or compared < max_frames:
+                count = block
+                if max_frames is not None:
+                    count = min(block, max_frames - compared)
+                reference_future = pool.submit(
+                    read_block, reference_cap, count, transform
+                )
+                test = read_block(test_cap, count)
+                reference = reference_future.result()
+                common = min(len(reference), len(test))
+                extra_frames += abs(len(reference) - len(test))
+                if common == 0:
+                    break
+                x, y = luma_blocks(reference[:common], test[:common])
+                psnr_values.append(block_psnr(x, y))
+                ssim_values.append(block_ssim(x, y))
+                compared += common
+                if common < count:
+                    break
+    finally:
+        reference_cap.release()
+        test_cap.release()
+    elapsed = time.perf_counter() - start
+
+    if not psnr_values:
+        raise RuntimeError(f"没有可对比的帧: {test_path}")
+    psnr = np.concatenate(psnr_values)
+    ssim = np.concatenate(ssim_values)
+    result = {
+        "frames": len(psnr),
+        "frame_mismatch": extra_frames,
+        "psnr_mean": round(float(psnr.mean()), 3),
+        "psnr_min": round(float(psnr.min()), 3),
+        "ssim_mean": round(float(ssim.mean()), 5),
+        "ssim_min": round(float(ssim.min()), 5),
+        "worst_frame": int(start_frame + ssim.argmin()),
+        "compare_fps": round(len(psnr) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    if per_frame:
+        result["per_frame"] = {
+            "psnr": [round(float(v), 3) for v in psnr],
+            "ssim": [round(float(v), 5) for v in ssim],
+        }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="计算导出视频相对源视频裁切的 PSNR/SSIM"
+    )
+    parser.add_argument("reference", help="源视频")
+    parser.add_argument("exported", help="导出的视频")
+    parser.add_argument("--crop", type=parse_crop, help="导出时的裁切区域 x1,y1,x2,y2")
+    parser.add_argument("--width", type=int, default=0, help="导出时的输出宽度")
+    parser.add_argument("--height", type=int, default=0, help="导出时的输出高度")
+    parser.add_argument("--start-frame", type=int, default=0, help="导出入点对应的帧号")
+    parser.add_argument("--block", type=int, default=16, help="每组批量计算的帧数")
+    parser.add_argument("--max-frames", type=int)
+    parser.add_argument("--per-frame", action="store_true", help="输出逐帧数值")
+    args = parser.parse_args(argv)
+
+    target_size = None
+    if args.width or args.height:
+        if not (args.width and args.height):
+            parser.error("--width 和 --height 需同时指定")
+        target_size = (args.width, args.height)
+    result = compare_videos(
+        args.reference,
+        args.exported,
+        args.crop,
+        target_size,
+        args.start_frame,
+        args.block,
+        args.max_frames,
+        args.per_frame,
+    )
+    print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
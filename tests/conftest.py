@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lazy_modules import ffmpeg_binary  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def synthetic_clip(tmp_path_factory):
+    """640x360、30 fps、4 秒、每秒一个关键帧的合成视频（无音轨）"""
+    path = str(tmp_path_factory.mktemp("clips") / "synth.mp4")
+    subprocess.run(
+        [
+            ffmpeg_binary(),
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            "testsrc2=size=640x360:rate=30:duration=4",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "ultrafast",
+            "-g",
+            "30",
+            "-pix_fmt",
+            "yuv420p",
+            path,
+        ],
+        check=True,
+    )
+    return path
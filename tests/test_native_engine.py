@@ -0,0 +1,52 @@
+import json
+import re
+import shutil
+import subprocess
+
+import crop_engine
+from lazy_modules import ffmpeg_binary
+
+
+def sample_aspect_ratio(path):
+    """视频流的 SAR，有 ffprobe 时用 ffprobe，否则从 ffmpeg -i 的输出中读取"""
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe:
+        result = subprocess.run(
+            [
+                ffprobe,
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "stream=sample_aspect_ratio",
+                "-of",
+                "json",
+                path,
+            ],
+            capture_output=True,
+            check=True,
+        )
+        return json.loads(result.stdout)["streams"][0]["sample_aspect_ratio"]
+    result = subprocess.run(
+        [ffmpeg_binary(), "-hide_banner", "-i", path], capture_output=True
+    )
+    match = re.search(r"Video: .*\[SAR (\d+:\d+)", result.stderr.decode())
+    return match.group(1) if match else "1:1"
+
+
+def test_native_square_output_has_square_pixels(synthetic_clip, tmp_path):
+    output = str(tmp_path / "native.mp4")
+    job = crop_engine.CropJob(
+        synthetic_clip, output, (0, 0, 360, 340), (240, 240), engine="ffmpeg"
+    )
+    crop_engine.export_video(job)
+    assert sample_aspect_ratio(output) == "1:1"
+
+
+def test_filter_graph_resets_sar_on_every_chain():
+    graph = crop_engine.native_filter_graph(
+        [(0, 0, 360, 340), (0, 0, 200, 200)], [(240, 240), (200, 200)]
+    )
+    chains = graph.split(";")[1:]
+    assert all(",setsar=1[" in chain for chain in chains)
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+import crop_engine
+
+
+def test_resumable_export_with_relative_output(synthetic_clip, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("out")
+    job = crop_engine.CropJob(
+        synthetic_clip, "out/clip.mp4", (0, 0, 320, 320), segments=2, resumable=True
+    )
+    stats = crop_engine.export_video(job)
+    assert stats["frames"] == 120
+    assert os.path.getsize("out/clip.mp4") > 0
+    assert not os.path.exists(crop_engine.resume_dir_for("out/clip.mp4"))
+
+
+def test_resumed_run_counts_only_newly_encoded_frames(
+    synthetic_clip, tmp_path, monkeypatch
+):
+    output = str(tmp_path / "clip.mp4")
+    job = crop_engine.CropJob(
+        synthetic_clip, output, (0, 0, 320, 320), segments=2, resumable=True
+    )
+    concat = crop_engine.concat_segments
+
+    def interrupted(*args, **kwargs):
+        raise RuntimeError("中断")
+
+    # 第一次在拼接前中断，分段和日志保留在 .parts 目录
+    monkeypatch.setattr(crop_engine, "concat_segments", interrupted)
+    with pytest.raises(RuntimeError):
+        crop_engine.export_video(job)
+    monkeypatch.setattr(crop_engine, "concat_segments", concat)
+
+    stats = crop_engine.export_video(job)
+    assert stats["frames"] == 120
+    assert stats["fps"] == 0.0
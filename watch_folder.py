@@ -0,0 +1,399 @@
+"""监视文件夹：新素材拷入后按文件夹预设自动裁切导出
+
+任务写入 SQLite 持久队列（进程重启后继续），按优先级取出；调度器按 CPU 核数
+和每个任务的编码线程数决定同时运行的任务数，避免多个导出互相争抢核心。
+当前任务编码期间，后台预读下一个输入的文件头和视频信息（需要时顺带完成自动裁切分析）。
+
+示例:
+    python watch_folder.py watch.json
+
+配置文件格式:
+    {
+        "queue": "watch_queue.sqlite3",
+        "folders": [
+            {"path": "素材/A机位", "output": "输出/A机位", "crop": [420, 0, 1500, 1080],
+             "mode": "square", "width": 720, "priority": 10, "profile": "fast",
+             "threads": 2}
+        ]
+    }
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+import auto_crop
+from crop_engine import (
+    CropJob,
+    compute_target_size,
+    default_output_path,
+    export_with_sink,
+    format_stages,
+)
+from encoder_profiles import PROFILES
+from export_metrics import JsonLinesSink
+from lazy_modules import LazyModule
+
+cv2 = LazyModule("cv2")
+
+DEFAULT_PATTERNS = ("*.mp4", "*.mov", "*.mkv", "*.avi", "*.mts")
+# 扫描间隔（秒）
+POLL_SECONDS = 5.0
+# 文件大小和修改时间保持不变超过该时长才视为拷贝完成
+SETTLE_SECONDS = 10.0
+# 预读文件头的字节数（mp4 的 moov 可能在文件末尾，首尾各读一次）
+PREFETCH_BYTES = 4 * 1024 * 1024
+
+
+class FolderPreset:
+    """一个监视文件夹的裁切预设，字段与裁切配置文件一致"""
+
+    def __init__(self, spec):
+        self.path = os.path.abspath(spec["path"])
+        self.output_dir = os.path.abspath(
+            spec.get("output") or os.path.join(self.path, "cropped")
+        )
+        self.patterns = tuple(spec.get("patterns", DEFAULT_PATTERNS))
+        self.priority = int(spec.get("priority", 0))
+        # 裁切区域 [x1, y1, x2, y2]，"auto" 表示对每个输入自动检测
+        self.crop = spec.get("crop", "auto")
+        self.square = spec.get("mode") == "square"
+        self.width = int(spec.get("width", 0))
+        self.height = int(spec.get("height", 0))
+        self.profile = spec.get("profile", "default")
+        if self.profile not in PROFILES:
+            raise ValueError(f"未知的编码配置: {self.profile}")
+        self.threads = int(spec.get("threads", 4))
+        self.segments = int(spec.get("segments", 1))
+        self.audio_mode = spec.get("audio", "auto")
+
+    @property
+    def auto(self):
+        return self.crop == "auto"
+
+    @property
+    def cores(self):
+        """任务占用的核心数：分段导出时每段各有一个编码器"""
+        return self.threads * max(1, self.segments)
+
+    def matches(self, name):
+        # 跳过本工具的输出，输出目录位于监视目录内时不会被重新导入
+        if name.startswith("cropped_") or name.endswith(".part.mp4"):
+            return False
+        return any(fnmatch.fnmatch(name.lower(), p.lower()) for p in self.patterns)
+
+    def build_job(self, path, crop_coords=None):
+        """生成导出任务，crop_coords 为预读阶段得到的自动裁切结果"""
+        if crop_coords is None:
+            crop_coords = (
+                auto_crop.suggest_crop(path, self.square) if self.auto else self.crop
+            )
+        return CropJob(
+            path,
+            default_output_path(path, self.output_dir),
+            crop_coords,
+            compute_target_size(crop_coords, self.width, self.height, self.square),
+            audio_mode=self.audio_mode,
+            threads=self.threads,
+            segments=self.segments,
+            encoder=PROFILES[self.profile],
+        )
+
+
+class JobQueue:
+    """SQLite 持久任务队列，同一文件（路径、大小、修改时间相同）只入队一次
+
+    只在调度线程中使用。
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                input TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                folder TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                added REAL NOT NULL,
+                finished REAL,
+                error TEXT,
+                UNIQUE (input, size, mtime_ns)
+            )""")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (state, priority, id)"
+        )
+
+    def add(self, path, size, mtime_ns, folder, priority):
+        """入队，已存在时返回 False"""
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO jobs (input, size, mtime_ns, folder, priority, added)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (path, size, mtime_ns, folder, priority, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def peek(self, limit=1):
+        """按优先级（高在前）、入队顺序返回等待中的 [(id, 路径, 监视文件夹路径)]"""
+        return self.conn.execute(
+            "SELECT id, input, folder FROM jobs WHERE state = 'queued'"
+            " ORDER BY priority DESC, id LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    def mark_running(self, job_id):
+        self.conn.execute("UPDATE jobs SET state = 'running' WHERE id = ?", (job_id,))
+
+    def finish(self, job_id, error=None):
+        self.conn.execute(
+            "UPDATE jobs SET state = ?, finished = ?, error = ? WHERE id = ?",
+            ("failed" if error else "done", time.time(), error, job_id),
+        )
+
+    def requeue_running(self):
+        """上次退出时未完成的任务重新排队，返回数量"""
+        return self.conn.execute(
+            "UPDATE jobs SET state = 'queued' WHERE state = 'running'"
+        ).rowcount
+
+    def counts(self):
+        return dict(
+            self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+        )
+
+
+def scan_folders(presets, job_queue, pending, settle_seconds=SETTLE_SECONDS):
+    """扫描监视目录，把拷贝完成的新文件入队，返回新入队的数量
+
+    pending 记录 {路径: (大小, 修改时间, 首次看到该状态的时间)}，跨次扫描保留。
+    """
+    now = time.monotonic()
+    added = 0
+    for preset in presets:
+        try:
+            entries = list(os.scandir(preset.path))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if not entry.is_file() or not preset.matches(entry.name):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            state = (stat.st_size, stat.st_mtime_ns)
+            seen = pending.get(entry.path)
+            if seen is None or seen[:2] != state:
+                pending[entry.path] = (*state, now)
+                continue
+            if now - seen[2] < settle_seconds:
+                continue
+            del pending[entry.path]
+            if job_queue.add(entry.path, *state, preset.path, preset.priority):
+                added += 1
+                print(f"[入队] {entry.path}")
+    return added
+
+
+def prefetch_input(path, preset):
+    """预读文件头/尾和视频信息，需要时完成自动裁切，返回裁切区域（非自动时为 None）"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.read(PREFETCH_BYTES)
+        if size > PREFETCH_BYTES:
+            f.seek(max(PREFETCH_BYTES, size - PREFETCH_BYTES))
+            f.read(PREFETCH_BYTES)
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError(f"无法打开视频文件: {path}")
+    finally:
+        cap.release()
+    if preset.auto:
+        return auto_crop.suggest_crop(path, preset.square)
+    return None
+
+
+class Scheduler:
+    """按核心预算并发执行队列中的任务
+
+    每个任务占用 preset.cores 个核心，已用核心加上队首任务超过预算时等待；
+    预算小于单个任务的需求时仍允许一次运行一个。严格按优先级出队，
+    小任务不会插到等待中的大任务前面。自动裁切的任务等后台预读完成后才启动，
+    等待期间调度循环照常处理其他已完成的任务。
+    """
+
+    def __init__(self, presets, job_queue, cores=None, metrics_sink=None):
+        # 队列中按监视文件夹路径记录预设，配置增删或调整顺序后仍能对应
+        self.presets = {preset.path: preset for preset in presets}
+        self.queue = job_queue
+        self.cores = cores or os.cpu_count() or 1
+        self.metrics_sink = metrics_sink
+        self.pool = ProcessPoolExecutor(max_workers=self.cores)
+        self.prefetcher = ThreadPoolExecutor(max_workers=1)
+        # {队列 id: 预读 future}
+        self.prefetched = {}
+        # {导出 future: (队列 id, 路径, 占用核心数)}
+        self.running = {}
+
+    @property
+    def used_cores(self):
+        return sum(cores for _, _, cores in self.running.values())
+
+    def fill(self):
+        """在预算内启动尽可能多的任务，再为下一个等待的任务安排预读"""
+        while True:
+            head = self.queue.peek()
+            if not head:
+                return
+            job_id, path, folder = head[0]
+            preset = self.presets.get(folder)
+            if preset is None:
+                self.queue.finish(job_id, f"监视文件夹已不在配置中: {folder}")
+                print(f"[失败] {path}: 监视文件夹已不在配置中")
+                continue
+            if self.running and self.used_cores + preset.cores > self.cores:
+                self.prefetch(job_id, path, preset)
+                return
+            if preset.auto:
+                # 自动裁切在预读线程中完成，未完成时留到下一轮调度
+                self.prefetch(job_id, path, preset)
+                if not self.prefetched[job_id].done():
+                    return
+            self.start(job_id, path, preset)
+
+    def prefetch(self, job_id, path, preset):
+        if job_id not in self.prefetched:
+            self.prefetched[job_id] = self.prefetcher.submit(
+                prefetch_input, path, preset
+            )
+
+    def start(self, job_id, path, preset):
+        self.queue.mark_running(job_id)
+        try:
+            crop = None
+            future = self.prefetched.pop(job_id, None)
+            # 非自动裁切的预读只为预热文件缓存，不必等它结束
+            if future is not None and future.done():
+                crop = future.result()
+            job = preset.build_job(path, crop)
+            os.makedirs(preset.output_dir, exist_ok=True)
+            export = self.pool.submit(export_with_sink, job, self.metrics_sink)
+        except Exception as e:
+            self.queue.finish(job_id, str(e))
+            print(f"[失败] {path}: {e}")
+            return
+        self.running[export] = (job_id, path, preset.cores)
+        print(f"[开始] {path}  占用 {self.used_cores}/{self.cores} 核")
+        # 当前任务编码期间预读下一个输入
+        for next_id, next_path, next_folder in self.queue.peek(2):
+            if next_id != job_id:
+                if next_folder in self.presets:
+                    self.prefetch(next_id, next_path, self.presets[next_folder])
+                break
+
+    def reap(self, timeout):
+        """等待至多 timeout 秒，处理已完成的任务，返回完成数量"""
+        if not self.running:
+            time.sleep(timeout)
+            return 0
+        done, _ = wait(self.running, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            job_id, path, _ = self.running.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                self.queue.finish(job_id, str(e))
+                print(f"[失败] {path}: {e}")
+                continue
+            self.queue.finish(job_id)
+            print(
+                f"[完成] {result['output']}  {result['frames']} 帧  "
+                f"{result['fps']:.1f} fps  {result['wall_time']:.2f} s"
+            )
+            print(f"       {format_stages(result['metrics'])}")
+        return len(done)
+
+    def idle(self):
+        return not self.running and not self.queue.peek()
+
+    def shutdown(self):
+        self.prefetcher.shutdown(wait=False, cancel_futures=True)
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def load_config(path):
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    if not config.get("folders"):
+        raise ValueError(f"监视配置缺少 folders: {path}")
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="监视文件夹并自动裁切新素材")
+    parser.add_argument("config", help="JSON 监视配置文件")
+    parser.add_argument(
+        "--once", action="store_true", help="扫描一次并处理完队列后退出"
+    )
+    parser.add_argument("--cores", type=int, help="核心预算，默认为 CPU 核数")
+    parser.add_argument("--metrics-jsonl", metavar="PATH", help="指标事件输出文件")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    presets = [FolderPreset(spec) for spec in config["folders"]]
+    queue_path = config.get(
+        "queue",
+        os.path.join(
+            os.path.dirname(os.path.abspath(args.config)), "watch_queue.sqlite3"
+        ),
+    )
+    poll = float(config.get("poll_seconds", POLL_SECONDS))
+    settle = 0.0 if args.once else float(config.get("settle_seconds", SETTLE_SECONDS))
+
+    job_queue = JobQueue(queue_path)
+    restored = job_queue.requeue_running()
+    if restored:
+        print(f"[恢复] {restored} 个未完成的任务重新排队")
+    sink = JsonLinesSink(args.metrics_jsonl) if args.metrics_jsonl else None
+    scheduler = Scheduler(presets, job_queue, args.cores, sink)
+    pending = {}
+    try:
+        if args.once:
+            # 第一次扫描只记录状态，第二次入队
+            scan_folders(presets, job_queue, pending, settle)
+        next_scan = 0.0
+        while True:
+            if time.monotonic() >= next_scan:
+                scan_folders(presets, job_queue, pending, settle)
+                next_scan = time.monotonic() + poll
+            scheduler.fill()
+            if args.once and scheduler.idle():
+                break
+            scheduler.reap(min(poll, 1.0))
+    except KeyboardInterrupt:
+        print("已停止，未完成的任务将在下次启动时继续")
+    finally:
+        scheduler.shutdown()
+    counts = job_queue.counts()
+    print(
+        f"队列：完成 {counts.get('done', 0)} 个，失败 {counts.get('failed', 0)} 个，"
+        f"等待 {counts.get('queued', 0) + counts.get('running', 0)} 个"
+    )
+    return 1 if counts.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())